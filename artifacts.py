@@ -0,0 +1,102 @@
+import os
+import re
+import hashlib
+from pathlib import Path
+from typing import Optional
+
+from metrics import metrics
+
+# ============================================================================
+# 大工具输出的内容寻址存储
+# ============================================================================
+# 超过阈值的工具输出只写盘一次，消息历史里只保留预览 + 句柄，
+# 避免每轮 decision 和每个 checkpoint 都重复携带整段输出。
+
+ARTIFACTS_DIR = os.environ.get("ARTIFACTS_DIR", "./.artifacts")
+# 超过该字符数的工具输出写入 artifact
+ARTIFACT_THRESHOLD = int(os.environ.get("ARTIFACT_THRESHOLD", "4000"))
+# 消息中保留的预览字符数
+ARTIFACT_PREVIEW_CHARS = int(os.environ.get("ARTIFACT_PREVIEW_CHARS", "800"))
+# read_artifact 单次最多返回的字节数
+ARTIFACT_MAX_READ = int(os.environ.get("ARTIFACT_MAX_READ", "8000"))
+
+_ID_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class ArtifactStore:
+    def __init__(self, root: str = ARTIFACTS_DIR, threshold: int = ARTIFACT_THRESHOLD,
+                 preview_chars: int = ARTIFACT_PREVIEW_CHARS):
+        self.root = Path(root)
+        self.threshold = threshold
+        self.preview_chars = preview_chars
+
+    def path(self, artifact_id: str) -> Optional[Path]:
+        artifact_id = artifact_id.strip()
+        if artifact_id.startswith("artifact://"):
+            artifact_id = artifact_id[len("artifact://"):]
+        if not _ID_RE.match(artifact_id):
+            return None
+        return self.root / artifact_id[:2] / artifact_id
+
+    def put(self, text: str) -> str:
+        data = text.encode("utf-8")
+        artifact_id = hashlib.sha256(data).hexdigest()
+        path = self.path(artifact_id)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{artifact_id}.{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            metrics.inc("artifacts.written")
+            metrics.inc("artifacts.bytes", len(data))
+        return artifact_id
+
+    def should_spill(self, text: str) -> bool:
+        return self.threshold > 0 and len(text) > self.threshold
+
+    def spill(self, text: str) -> str:
+        """把大输出写入 artifact，返回放进 ToolMessage 的预览文本"""
+        artifact_id = self.put(text)
+        size = len(text.encode("utf-8"))
+        lines = text.count("\n") + 1
+        metrics.inc("artifacts.spilled")
+        return (
+            f"{text[:self.preview_chars]}\n\n"
+            f"... [输出过长，已保存为 artifact://{artifact_id}，共 {size} 字节 / {lines} 行；"
+            f"如需更多内容请调用 read_artifact 按字节或行范围读取]"
+        )
+
+    def read_bytes(self, artifact_id: str, offset: int = 0, length: int = ARTIFACT_MAX_READ) -> str:
+        path = self.path(artifact_id)
+        if path is None or not path.exists():
+            return f"Error: artifact '{artifact_id}' not found."
+        length = max(0, min(length, ARTIFACT_MAX_READ))
+        with open(path, "rb") as f:
+            f.seek(max(0, offset))
+            data = f.read(length)
+        return data.decode("utf-8", errors="ignore")
+
+    def read_lines(self, artifact_id: str, start_line: int, end_line: Optional[int] = None) -> str:
+        """读取 [start_line, end_line] 行（从 1 开始，含两端），总长度受 ARTIFACT_MAX_READ 限制"""
+        path = self.path(artifact_id)
+        if path is None or not path.exists():
+            return f"Error: artifact '{artifact_id}' not found."
+        start_line = max(1, start_line)
+        out = []
+        used = 0
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            for lineno, line in enumerate(f, 1):
+                if lineno < start_line:
+                    continue
+                if end_line is not None and lineno > end_line:
+                    break
+                used += len(line)
+                if used > ARTIFACT_MAX_READ:
+                    out.append(f"... [已达到单次读取上限，请从第 {lineno} 行继续读取]")
+                    break
+                out.append(line.rstrip("\n"))
+        return "\n".join(out)
+
+
+artifact_store = ArtifactStore()
@@ -0,0 +1,183 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import statistics
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from langchain_core.messages import HumanMessage
+
+from llm2 import close_llm
+from mcp_manager import mcp_manager
+from run import graph, final_answer
+from tool_runtime import tool_runner
+
+# ============================================================================
+# 批量执行：python batch.py tasks.jsonl -o results.jsonl -c 8
+# ============================================================================
+# 输入每行一个任务：{"id": "可选，默认取行号", "message": "..."}
+# 输出每完成一个任务追加一行结果，重新运行同一输出文件时跳过已成功的任务。
+
+# 同时执行的任务数
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "8"))
+# 单个任务的超时（秒）
+BATCH_TASK_TIMEOUT = float(os.environ.get("BATCH_TASK_TIMEOUT", "300"))
+
+
+def read_tasks(path: str) -> Iterator[Tuple[str, str]]:
+    """逐行读取任务，返回 (task_id, message)；无法解析的行跳过并提示"""
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                task = json.loads(line)
+            except ValueError:
+                print(f"⚠️ 第 {lineno} 行不是合法 JSON，已跳过")
+                continue
+            message = (task.get("message") or task.get("query")) if isinstance(task, dict) else None
+            if not isinstance(message, str) or not message.strip():
+                print(f"⚠️ 第 {lineno} 行缺少 message，已跳过")
+                continue
+            yield str(task.get("id", lineno)), message
+
+
+def completed_ids(path: str, retry_failed: bool = True) -> Set[str]:
+    """已有输出中完成的任务；retry_failed 时失败的任务会重新执行"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    # 中断时最后一行可能截断在多字节字符中间，解码失败的字节替换掉，该行随后按半行忽略
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 中断时可能留下半行，忽略
+                continue
+            if not retry_failed or record.get("status") == "ok":
+                done.add(str(record.get("id")))
+    return done
+
+
+def ends_with_newline(path: str) -> bool:
+    """文件为空、不存在或以换行结尾；按字节检查，不受截断的多字节字符影响"""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return True
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class BatchRunner:
+    def __init__(self, output_path: str, concurrency: int = BATCH_CONCURRENCY,
+                 task_timeout: float = BATCH_TASK_TIMEOUT):
+        self.output_path = output_path
+        self.concurrency = max(1, concurrency)
+        self.task_timeout = task_timeout
+        self.elapsed: list = []
+        self.ok = 0
+        self.failed = 0
+        self._out = None
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        # 一次 write 写完整行并立即 flush，中断时最多丢失正在执行的任务
+        self._out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._out.flush()
+
+    async def run_one(self, task_id: str, message: str) -> Dict[str, Any]:
+        start = time.perf_counter()
+        record: Dict[str, Any] = {"id": task_id, "message": message}
+        try:
+            result = await asyncio.wait_for(
+                graph.ainvoke({"messages": [HumanMessage(content=message)]}), self.task_timeout
+            )
+            record.update(status="ok", answer=final_answer(result), steps=len(result["messages"]))
+        except asyncio.TimeoutError:
+            record.update(status="error", error=f"timed out after {self.task_timeout:g}s")
+        except Exception as e:
+            record.update(status="error", error=f"{type(e).__name__}: {e}")
+        record["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return record
+
+    async def _worker(self, queue: "asyncio.Queue[Optional[Tuple[str, str]]]") -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            record = await self.run_one(*item)
+            self._write(record)
+            self.elapsed.append(record["elapsed_ms"])
+            if record["status"] == "ok":
+                self.ok += 1
+            else:
+                self.failed += 1
+                print(f"❌ {record['id']}: {record['error']}")
+            done = self.ok + self.failed
+            if done % 10 == 0:
+                print(f"📊 已完成 {done} 个任务（失败 {self.failed}）")
+
+    async def run(self, tasks_path: str, retry_failed: bool = True) -> None:
+        skip = completed_ids(self.output_path, retry_failed)
+        if skip:
+            print(f"⏭️ 跳过已完成的 {len(skip)} 个任务")
+
+        # 有界队列：任务逐行读入，不一次性加载整个文件
+        queue: "asyncio.Queue[Optional[Tuple[str, str]]]" = asyncio.Queue(maxsize=self.concurrency * 2)
+        start = time.perf_counter()
+        # 上次中断可能留下不完整的最后一行，先补换行再追加
+        missing_newline = not ends_with_newline(self.output_path)
+        with open(self.output_path, "a", encoding="utf-8") as self._out:
+            if missing_newline:
+                self._out.write("\n")
+            workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+            for task_id, message in read_tasks(tasks_path):
+                if task_id in skip:
+                    continue
+                skip.add(task_id)  # 输入里重复的 id 只执行一次
+                await queue.put((task_id, message))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        self.report(time.perf_counter() - start)
+
+    def report(self, wall_seconds: float) -> None:
+        total = self.ok + self.failed
+        print(f"\n{'=' * 60}\n📦 批量执行完成: {total} 个任务, 成功 {self.ok}, 失败 {self.failed}")
+        if not total:
+            return
+        ordered = sorted(self.elapsed)
+        print(f"   吞吐 {total / max(wall_seconds, 1e-9):.2f} 任务/秒, 总耗时 {wall_seconds:.1f}s, 并发 {self.concurrency}")
+        print(f"   单任务耗时 p50={statistics.median(ordered):.0f}ms "
+              f"p95={ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]:.0f}ms")
+
+
+async def _run_batch(tasks_path: str, output_path: str, concurrency: int, retry_failed: bool) -> None:
+    try:
+        await BatchRunner(output_path, concurrency).run(tasks_path, retry_failed)
+    finally:
+        await mcp_manager.shutdown()
+        await close_llm()
+        tool_runner.shutdown()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="批量执行 JSONL 任务")
+    parser.add_argument("tasks", help="输入 JSONL，每行 {\"id\": ..., \"message\": ...}")
+    parser.add_argument("-o", "--output", help="结果 JSONL（默认 <输入>.results.jsonl）")
+    parser.add_argument("-c", "--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--no-retry-failed", action="store_true", help="续跑时不重新执行失败的任务")
+    args = parser.parse_args()
+    output = args.output or f"{os.path.splitext(args.tasks)[0]}.results.jsonl"
+    try:
+        asyncio.run(_run_batch(args.tasks, output, args.concurrency, not args.no_retry_failed))
+    except KeyboardInterrupt:
+        print(f"\n⏸️ 已中断，重新运行同一命令即可从 {output} 续跑")
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import sys
+import json
+import time
+import statistics
+from typing import Callable, List, Tuple
+
+from langchain_core.tools import StructuredTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from retrieval import estimate_tokens
+from skill import SkillRegistry, SKILLS_DIR, SKILLS_TOP_K
+from tool_retrieval import ToolRanker, TOOLS_TOP_N
+
+# ============================================================================
+# 基准测试：python bench.py [skills] [tools]
+# ============================================================================
+
+# (用户请求, 期望出现在 prompt 中的 skill_id)
+SKILL_QUERIES: List[Tuple[str, str]] = [
+    ("明天北京天气如何", "amap"),
+    ("从公司到首都机场怎么走", "amap"),
+    ("附近有什么好吃的餐厅", "amap"),
+    ("帮我搜索一下最新的AI新闻", "web-search"),
+    ("上网查一下这个问题的答案", "web-search"),
+    ("帮我查一下 github 上这个仓库的 PR", "github"),
+    ("list open issues on GitHub", "github"),
+    ("写一个Python脚本批量重命名文件", "python-coder"),
+    ("帮我优化这段Python代码", "python-coder"),
+    ("每天凌晨3点运行备份脚本", "cron-manager"),
+    ("添加一个 crontab 定时任务", "cron-manager"),
+    ("下周五是几号", "parse_times"),
+    ("create a new skill for weather", "skill-creator"),
+    ("用婷婷的声音把这段话读出来", "mac-tingting"),
+    ("add a note to Apple Notes", "apple-notes"),
+    ("remind me to buy milk", "apple-reminders"),
+    ("send a message in slack channel", "slack"),
+    ("post a tweet on X", "bird"),
+    ("transcribe this audio file with whisper", "openai-whisper"),
+    ("generate an image of a cat", "openai-image-gen"),
+    ("extract frames from this video", "video-frames"),
+    ("turn off the hue lights in the living room", "openhue"),
+    ("play some music on spotify", "spotify-player"),
+    ("summarize this youtube video", "summarize"),
+    ("read my email inbox", "himalaya"),
+    ("add a card to my trello board", "trello"),
+    ("create a page in notion", "notion"),
+    ("send a whatsapp message to mom", "wacli"),
+    ("get the secret from 1password", "1password"),
+    ("control the tmux session", "tmux"),
+]
+
+
+# amap-maps MCP server 的工具（名称、描述、参数），离线复现 list_tools 的结果
+AMAP_TOOLS: List[Tuple[str, str, List[str]]] = [
+    ("maps_regeocode", "将一个高德经纬度坐标转换为行政区划地址信息", ["location"]),
+    ("maps_geo", "将详细的结构化地址转换为经纬度坐标。支持对地标性名胜景区、建筑物名称解析为经纬度坐标", ["address", "city"]),
+    ("maps_ip_location", "IP 定位根据用户输入的 IP 地址，定位 IP 的所在位置", ["ip"]),
+    ("maps_weather", "根据城市名称或者标准adcode查询指定城市的天气", ["city"]),
+    ("maps_search_detail", "查询关键词搜或者周边搜获取到的POI ID的详细信息", ["id"]),
+    ("maps_bicycling", "骑行路径规划用于规划骑行通勤方案，规划时会考虑天桥、单行线、封路等情况。最大支持 500km 的骑行路线规划",
+     ["origin", "destination"]),
+    ("maps_direction_walking", "步行路径规划 API 可以根据输入起点终点经纬度坐标规划100km 以内的步行通勤方案，并且返回通勤方案的数据",
+     ["origin", "destination"]),
+    ("maps_direction_driving", "驾车路径规划 API 可以根据用户起终点经纬度坐标规划以小客车、轿车通勤出行的方案，并且返回通勤方案的数据。",
+     ["origin", "destination"]),
+    ("maps_direction_transit_integrated",
+     "公交路径规划 API 可以根据用户起终点经纬度坐标规划综合各类公共（火车、公交、地铁）交通方式的通勤方案，并且返回通勤方案的数据，"
+     "跨城场景下必须传起点城市与终点城市", ["origin", "destination", "city", "cityd"]),
+    ("maps_distance", "距离测量 API 可以测量两个经纬度坐标之间的距离,支持驾车、步行以及球面距离测量",
+     ["origins", "destination", "type"]),
+    ("maps_text_search", "关键词搜，根据用户传入关键词，搜索出相关的POI", ["keywords", "city", "types"]),
+    ("maps_around_search", "周边搜，根据用户传入关键词以及坐标location，搜索出radius半径范围的POI",
+     ["keywords", "location", "radius"]),
+]
+
+# (对话内容, 期望被绑定的工具)
+TOOL_QUERIES: List[Tuple[str, str]] = [
+    ("明天北京天气如何", "maps_weather"),
+    ("上海这周的天气预报", "maps_weather"),
+    ("从公司到首都机场怎么走", "maps_direction_driving"),
+    ("开车去天津要多久", "maps_direction_driving"),
+    ("步行去天安门要多久", "maps_direction_walking"),
+    ("骑行去颐和园的路线", "maps_bicycling"),
+    ("坐地铁去北京南站", "maps_direction_transit_integrated"),
+    ("附近有什么好吃的", "maps_around_search"),
+    ("找一下北京的星巴克", "maps_text_search"),
+    ("天安门的经纬度是多少", "maps_geo"),
+    ("这个坐标对应什么地址", "maps_regeocode"),
+    ("这两个地方距离多远", "maps_distance"),
+    ("根据我的IP看看我在哪个城市", "maps_ip_location"),
+    ("查看这个POI的详细信息", "maps_search_detail"),
+]
+
+
+def _fixture_tool(name: str, description: str, params: List[str]) -> StructuredTool:
+    async def call(**kwargs):
+        return ""
+
+    return StructuredTool(
+        name=name,
+        description=description,
+        args_schema={"type": "object", "properties": {p: {"type": "string"} for p in params}, "required": params[:1]},
+        coroutine=call,
+    )
+
+
+def _schema_tokens(tools) -> int:
+    return sum(estimate_tokens(json.dumps(convert_to_openai_tool(t), ensure_ascii=False)) for t in tools)
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def _time_us(fn: Callable[[], object], repeat: int = 200) -> Tuple[float, float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples), _percentile(samples, 0.95)
+
+
+def bench_skill_retrieval(skills_dir: str = SKILLS_DIR, top_k: int = SKILLS_TOP_K) -> None:
+    registry = SkillRegistry(skills_dir)
+    skills = registry.get_skills()
+    by_name = {info.get("name", skill_id): skill_id for skill_id, info in skills.items()}
+    cases = [(q, by_name.get(expected, expected)) for q, expected in SKILL_QUERIES]
+    cases = [(q, expected) for q, expected in cases if expected in skills]
+
+    full_prompt = registry.get_skills_prompt()
+    full_tokens = estimate_tokens(full_prompt)
+
+    hits = 0
+    fallbacks = 0
+    topk_tokens = []
+    for query, expected in cases:
+        ranked = registry.search(query, top_k)
+        if not ranked:
+            fallbacks += 1
+        prompt = registry.get_relevant_skills_prompt(query, top_k)
+        topk_tokens.append(estimate_tokens(prompt))
+        if f'id="{expected}"' in prompt:
+            hits += 1
+        else:
+            print(f"  miss: {query!r} -> {ranked} (expected {expected})")
+
+    full_p50, full_p95 = _time_us(registry.get_skills_prompt)
+    query = cases[0][0] if cases else ""
+    topk_p50, topk_p95 = _time_us(lambda: registry.get_relevant_skills_prompt(query, top_k))
+
+    print(f"skills={len(skills)} queries={len(cases)} top_k={top_k}")
+    print(f"  full listing : recall=1.000 tokens={full_tokens} "
+          f"latency p50={full_p50:.1f}us p95={full_p95:.1f}us")
+    print(f"  top-k        : recall={hits / max(len(cases), 1):.3f} "
+          f"tokens(avg)={statistics.mean(topk_tokens or [0]):.0f} fallbacks={fallbacks} "
+          f"latency p50={topk_p50:.1f}us p95={topk_p95:.1f}us")
+
+
+def bench_tool_selection(skills_dir: str = SKILLS_DIR, top_n: int = TOOLS_TOP_N) -> None:
+    registry = SkillRegistry(skills_dir)
+    skill_context = {"amap": registry.load_context("amap")} if registry.get_skill("amap") else {}
+    tools = [_fixture_tool(*spec) for spec in AMAP_TOOLS]
+    ranker = ToolRanker()
+
+    all_tokens = _schema_tokens(tools)
+    hits = 0
+    bound_tokens = []
+    bound_counts = []
+    for query, expected in TOOL_QUERIES:
+        selected = ranker.select(tools, query, skill_context=skill_context, top_n=top_n)
+        names = [t.name for t in selected]
+        bound_counts.append(len(selected))
+        bound_tokens.append(_schema_tokens(selected))
+        if expected in names:
+            hits += 1
+        else:
+            print(f"  miss: {query!r} -> {names} (expected {expected})")
+
+    query = TOOL_QUERIES[0][0]
+    p50, p95 = _time_us(lambda: ranker.select(tools, query, skill_context=skill_context, top_n=top_n))
+    avg_tokens = statistics.mean(bound_tokens)
+
+    print(f"tools={len(tools)} queries={len(TOOL_QUERIES)} top_n={top_n}")
+    print(f"  bind all     : recall=1.000 tools={len(tools)} schema_tokens={all_tokens}")
+    print(f"  top-n        : recall={hits / len(TOOL_QUERIES):.3f} tools(avg)={statistics.mean(bound_counts):.1f} "
+          f"schema_tokens(avg)={avg_tokens:.0f} saved={1 - avg_tokens / max(all_tokens, 1):.0%} "
+          f"latency p50={p50:.1f}us p95={p95:.1f}us")
+
+
+BENCHMARKS = {
+    "skills": bench_skill_retrieval,
+    "tools": bench_tool_selection,
+}
+
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"\n{'=' * 60}\n📏 {name}\n{'=' * 60}")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
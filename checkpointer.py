@@ -0,0 +1,559 @@
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import ormsgpack
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from metrics import metrics
+
+# ============================================================================
+# 增量 checkpoint：追加写 SQLite + 内容寻址 blob
+# ============================================================================
+# 每一步只写本步变化的通道：
+#   - messages 这类对象列表按元素存成内容寻址 blob，新版本只记录"基于上个版本追加了哪些元素"；
+#   - skill_context 这类字符串字典按值存 blob，多个会话 / 多个版本共享同一份；
+#   - 其它小值直接用 msgpack（JsonPlusSerializer）内联。
+# 因此单步写入量与本步新增的消息成正比，而不是与会话长度成正比。
+# 后台线程定期裁剪旧 checkpoint、删除长期没有写入的会话，并回收不再引用的通道值和 blob。
+
+# SQLite 文件路径，设为空字符串表示使用内存 checkpointer
+CHECKPOINT_DB = os.environ.get("CHECKPOINT_DB", "./.checkpoints.sqlite")
+# 每个会话保留最近多少个 checkpoint，<= 0 表示全部保留
+CHECKPOINT_KEEP_LAST = int(os.environ.get("CHECKPOINT_KEEP_LAST", "100"))
+# 后台压缩间隔（秒），<= 0 表示不做后台压缩
+CHECKPOINT_COMPACT_INTERVAL = float(os.environ.get("CHECKPOINT_COMPACT_INTERVAL", "300"))
+# 会话多久（秒）没有新 checkpoint 后整体删除，<= 0 表示永久保留；常驻服务使用 SERVER_SESSION_TTL
+CHECKPOINT_THREAD_TTL = float(os.environ.get("CHECKPOINT_THREAD_TTL", "0"))
+# 增量链超过该长度时写一次完整列表，限制读取时的回溯深度
+CHECKPOINT_MAX_DELTA_CHAIN = int(os.environ.get("CHECKPOINT_MAX_DELTA_CHAIN", "64"))
+# 元素 -> 哈希 的记忆条目数，避免每步重复序列化整段历史
+HASH_MEMO_SIZE = 8192
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash BLOB PRIMARY KEY,
+    type TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS channel_values (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    type TEXT,
+    payload BLOB,
+    base TEXT,
+    depth INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_id TEXT,
+    type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS checkpoint_versions (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, channel)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    value BLOB NOT NULL,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL
+);
+"""
+
+_PRIMITIVES = (str, int, float, bool, type(None))
+
+
+def _ref(thread_id: str, checkpoint_ns: str, checkpoint_id: Optional[str]) -> Optional[RunnableConfig]:
+    if not checkpoint_id:
+        return None
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+
+class DeltaCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    LangGraph checkpointer。同步方法直接访问 SQLite（单连接 + 锁），异步方法经 asyncio.to_thread 调用。
+    """
+
+    def __init__(self, path: str = CHECKPOINT_DB, keep_last: int = CHECKPOINT_KEEP_LAST,
+                 compact_interval: float = CHECKPOINT_COMPACT_INTERVAL,
+                 max_delta_chain: int = CHECKPOINT_MAX_DELTA_CHAIN,
+                 thread_ttl: float = CHECKPOINT_THREAD_TTL, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.keep_last = keep_last
+        self.compact_interval = compact_interval
+        self.max_delta_chain = max_delta_chain
+        self.thread_ttl = thread_ttl
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.executescript(_SCHEMA)
+        # 旧版本数据库里的会话没有写入时间，从现在开始计时
+        self._conn.execute(
+            "INSERT OR IGNORE INTO threads SELECT DISTINCT thread_id, ? FROM checkpoints", (time.time(),)
+        )
+        # (thread, ns, channel) -> (version, 元素哈希列表, 增量链深度)，供下一步计算增量
+        self._last_lists: Dict[Tuple[str, str, str], Tuple[str, List[bytes], int]] = {}
+        # id(元素) -> (元素, 哈希)；持有元素引用保证 id 不被复用
+        self._hash_memo: "OrderedDict[int, Tuple[Any, bytes]]" = OrderedDict()
+        self._stop = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+        if compact_interval > 0:
+            self._compactor = threading.Thread(target=self._compact_loop, name="checkpoint-compactor", daemon=True)
+            self._compactor.start()
+
+    # ------------------------------------------------------------------ 编码
+
+    def _blob(self, value: Any, rows: Dict[bytes, Tuple[str, bytes]]) -> bytes:
+        """序列化一个元素并返回它的内容哈希；新 blob 放进 rows 等待写入"""
+        memo = self._hash_memo.get(id(value))
+        if memo is not None and memo[0] is value:
+            self._hash_memo.move_to_end(id(value))
+            return memo[1]
+        type_, data = self.serde.dumps_typed(value)
+        digest = hashlib.sha1(type_.encode() + b"\0" + data).digest()
+        rows[digest] = (type_, data)
+        self._remember(value, digest)
+        return digest
+
+    def _remember(self, value: Any, digest: bytes) -> None:
+        if isinstance(value, _PRIMITIVES):
+            return
+        self._hash_memo[id(value)] = (value, digest)
+        self._hash_memo.move_to_end(id(value))
+        if len(self._hash_memo) > HASH_MEMO_SIZE:
+            self._hash_memo.popitem(last=False)
+
+    def _previous_list(self, thread_id: str, checkpoint_ns: str, channel: str) -> Optional[Tuple[str, List[bytes], int]]:
+        key = (thread_id, checkpoint_ns, channel)
+        cached = self._last_lists.get(key)
+        if cached is not None:
+            return cached
+        row = self._conn.execute(
+            "SELECT version, depth FROM channel_values WHERE thread_id=? AND checkpoint_ns=? AND channel=? "
+            "AND kind IN ('list', 'delta') ORDER BY rowid DESC LIMIT 1",
+            (thread_id, checkpoint_ns, channel),
+        ).fetchone()
+        if row is None:
+            return None
+        hashes = self._list_hashes(thread_id, checkpoint_ns, channel, row[0])
+        return row[0], hashes, row[1]
+
+    def _encode_channel(self, thread_id: str, checkpoint_ns: str, channel: str, version: str, value: Any,
+                        blobs: Dict[bytes, Tuple[str, bytes]]) -> Tuple:
+        """返回 channel_values 的一行 (kind, type, payload, base, depth)"""
+        if isinstance(value, list) and value and not all(isinstance(v, _PRIMITIVES) for v in value):
+            hashes = [self._blob(v, blobs) for v in value]
+            key = (thread_id, checkpoint_ns, channel)
+            prev = self._previous_list(thread_id, checkpoint_ns, channel)
+            self._last_lists[key] = (version, hashes, 0)
+            if prev is not None:
+                prev_version, prev_hashes, prev_depth = prev
+                n = len(prev_hashes)
+                if prev_depth < self.max_delta_chain and len(hashes) >= n and hashes[:n] == prev_hashes:
+                    self._last_lists[key] = (version, hashes, prev_depth + 1)
+                    metrics.inc("checkpoint.delta_writes")
+                    return "delta", None, ormsgpack.packb(hashes[n:]), prev_version, prev_depth + 1
+            metrics.inc("checkpoint.full_writes")
+            return "list", None, ormsgpack.packb(hashes), None, 0
+        if isinstance(value, dict) and value and all(isinstance(v, str) for v in value.values()):
+            return "dict", None, ormsgpack.packb({k: self._blob(v, blobs) for k, v in value.items()}), None, 0
+        type_, data = self.serde.dumps_typed(value)
+        return "value", type_, data, None, 0
+
+    # ------------------------------------------------------------------ 解码
+
+    def _list_hashes(self, thread_id: str, checkpoint_ns: str, channel: str, version: str) -> List[bytes]:
+        added: List[List[bytes]] = []
+        while True:
+            row = self._conn.execute(
+                "SELECT kind, payload, base FROM channel_values "
+                "WHERE thread_id=? AND checkpoint_ns=? AND channel=? AND version=?",
+                (thread_id, checkpoint_ns, channel, version),
+            ).fetchone()
+            if row is None:
+                raise KeyError(f"missing checkpoint value {channel}@{version}")
+            added.append(ormsgpack.unpackb(row[1]))
+            if row[0] != "delta":
+                break
+            version = row[2]
+        hashes: List[bytes] = []
+        for part in reversed(added):
+            hashes.extend(part)
+        return hashes
+
+    def _load_blobs(self, hashes: Sequence[bytes]) -> Dict[bytes, Any]:
+        loaded: Dict[bytes, Any] = {}
+        unique = list(dict.fromkeys(hashes))
+        for i in range(0, len(unique), 500):
+            chunk = unique[i:i + 500]
+            rows = self._conn.execute(
+                f"SELECT hash, type, data FROM blobs WHERE hash IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for digest, type_, data in rows:
+                loaded[digest] = value = self.serde.loads_typed((type_, data))
+                # 读出的对象会原样回到下一次 put，记住哈希免得再序列化一遍
+                self._remember(value, digest)
+        return loaded
+
+    def _load_channel_values(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> Dict[str, Any]:
+        values: Dict[str, Any] = {}
+        for channel, version in versions.items():
+            row = self._conn.execute(
+                "SELECT kind, type, payload FROM channel_values "
+                "WHERE thread_id=? AND checkpoint_ns=? AND channel=? AND version=?",
+                (thread_id, checkpoint_ns, channel, str(version)),
+            ).fetchone()
+            if row is None or row[0] == "empty":
+                continue
+            kind, type_, payload = row
+            if kind == "value":
+                values[channel] = self.serde.loads_typed((type_, payload))
+            elif kind == "dict":
+                refs = ormsgpack.unpackb(payload)
+                blobs = self._load_blobs(list(refs.values()))
+                values[channel] = {k: blobs[h] for k, h in refs.items()}
+            else:
+                hashes = self._list_hashes(thread_id, checkpoint_ns, channel, str(version))
+                blobs = self._load_blobs(hashes)
+                values[channel] = [blobs[h] for h in hashes]
+        return values
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row: Tuple,
+               metadata: Optional[CheckpointMetadata] = None) -> CheckpointTuple:
+        checkpoint_id, parent_id, type_, data, metadata_type, metadata_data = row
+        checkpoint: Checkpoint = self.serde.loads_typed((type_, data))
+        writes = self._conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config=_ref(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_channel_values(thread_id, checkpoint_ns, checkpoint["channel_versions"]),
+            },
+            metadata=metadata if metadata is not None else self.serde.loads_typed((metadata_type, metadata_data)),
+            parent_config=_ref(thread_id, checkpoint_ns, parent_id),
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    # ------------------------------------------------------------------ BaseCheckpointSaver
+
+    def get_next_version(self, current: Optional[str], channel: None = None) -> str:
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        columns = "checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if checkpoint_id:
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id=?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            return self._tuple(thread_id, checkpoint_ns, row)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        where, params = [], []
+        if config:
+            where.append("thread_id=?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                where.append("checkpoint_ns=?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id=?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id<?")
+            params.append(before_id)
+        sql = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_id, type, checkpoint, metadata_type, metadata "
+               "FROM checkpoints")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        for row in rows:
+            if limit is not None and limit <= 0:
+                break
+            metadata = self.serde.loads_typed((row[6], row[7]))
+            if filter and not all(metadata.get(k) == v for k, v in filter.items()):
+                continue
+            if limit is not None:
+                limit -= 1
+            with self._lock:
+                item = self._tuple(row[0], row[1], row[2:], metadata)
+            yield item
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        start = time.perf_counter()
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_id = config["configurable"].get("checkpoint_id")
+        c = checkpoint.copy()
+        values = c.pop("channel_values")
+        type_, data = self.serde.dumps_typed(c)
+        metadata_type, metadata_data = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self._lock:
+            blobs: Dict[bytes, Tuple[str, bytes]] = {}
+            rows = []
+            for channel, version in new_versions.items():
+                if channel in values:
+                    row = self._encode_channel(thread_id, checkpoint_ns, channel, str(version), values[channel], blobs)
+                else:
+                    row = ("empty", None, None, None, 0)
+                rows.append((thread_id, checkpoint_ns, channel, str(version), *row))
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO blobs (hash, type, data) VALUES (?, ?, ?)",
+                    [(digest, t, d) for digest, (t, d) in blobs.items()],
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO channel_values "
+                    "(thread_id, checkpoint_ns, channel, version, kind, type, payload, base, depth) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (thread_id, checkpoint_ns, checkpoint["id"], parent_id, type_, data, metadata_type, metadata_data),
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO checkpoint_versions VALUES (?, ?, ?, ?, ?)",
+                    [(thread_id, checkpoint_ns, checkpoint["id"], ch, str(v))
+                     for ch, v in checkpoint["channel_versions"].items()],
+                )
+                self._conn.execute("INSERT OR REPLACE INTO threads VALUES (?, ?)", (thread_id, time.time()))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                # 缓存的上一版本可能没有落盘，下次从数据库重新读取
+                self._last_lists.clear()
+                raise
+
+        metrics.inc("checkpoint.puts")
+        metrics.inc("checkpoint.bytes", len(data) + len(metadata_data) + sum(
+            len(r[6] or b"") for r in rows) + sum(len(d) for _, d in blobs.values()))
+        metrics.inc("checkpoint.put_ms", (time.perf_counter() - start) * 1000)
+        return _ref(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        rows = []
+        replace = all(channel in WRITES_IDX_MAP for channel, _ in writes)
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self.serde.dumps_typed(value)
+            rows.append((thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                         channel, type_, data, task_path))
+        # 特殊通道（错误、中断等）覆盖写；普通写入已存在时保留原值
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        with self._lock:
+            self._conn.executemany(f"{verb} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._delete_threads([thread_id])
+            self._conn.execute("COMMIT")
+        # blob 可能被其它会话共享，留给压缩时统一回收
+
+    def _delete_threads(self, thread_ids: Sequence[str]) -> None:
+        # 调用方持有锁并已开启事务
+        rows = [(t,) for t in thread_ids]
+        for table in ("checkpoints", "checkpoint_versions", "channel_values", "writes", "threads"):
+            self._conn.executemany(f"DELETE FROM {table} WHERE thread_id=?", rows)
+        expired = set(thread_ids)
+        for key in [k for k in self._last_lists if k[0] in expired]:
+            del self._last_lists[key]
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None,
+                    limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # ------------------------------------------------------------------ 压缩
+
+    def _live_channel_values(self) -> Set[Tuple[str, str, str, str]]:
+        """仍被 checkpoint 引用的通道值，加上它们增量链上的所有基础版本"""
+        live = set(self._conn.execute(
+            "SELECT thread_id, checkpoint_ns, channel, version FROM checkpoint_versions"
+        ).fetchall())
+        bases = {}
+        for thread_id, ns, channel, version, base in self._conn.execute(
+                "SELECT thread_id, checkpoint_ns, channel, version, base FROM channel_values WHERE base IS NOT NULL"):
+            bases[(thread_id, ns, channel, version)] = (thread_id, ns, channel, base)
+        stack = [key for key in live if key in bases]
+        while stack:
+            base = bases[stack.pop()]
+            if base not in live:
+                live.add(base)
+                if base in bases:
+                    stack.append(base)
+        return live
+
+    def compact(self) -> Dict[str, int]:
+        """删除过期会话，裁剪每个会话 keep_last 之前的 checkpoint，回收无人引用的通道值和 blob"""
+        start = time.perf_counter()
+        stats = {"threads": 0, "checkpoints": 0, "channel_values": 0, "blobs": 0}
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                if self.thread_ttl > 0:
+                    # 包括之前进程留下、本进程从未访问过的会话
+                    expired = [t for (t,) in self._conn.execute(
+                        "SELECT thread_id FROM threads WHERE updated_at<?", (time.time() - self.thread_ttl,))]
+                    self._delete_threads(expired)
+                    stats["threads"] = len(expired)
+                if self.keep_last > 0:
+                    threads = self._conn.execute(
+                        "SELECT thread_id, checkpoint_ns FROM checkpoints GROUP BY thread_id, checkpoint_ns "
+                        "HAVING COUNT(*) > ?", (self.keep_last,)
+                    ).fetchall()
+                    for thread_id, ns in threads:
+                        cutoff = self._conn.execute(
+                            "SELECT checkpoint_id FROM checkpoints WHERE thread_id=? AND checkpoint_ns=? "
+                            "ORDER BY checkpoint_id DESC LIMIT 1 OFFSET ?", (thread_id, ns, self.keep_last - 1)
+                        ).fetchone()[0]
+                        for table in ("checkpoints", "checkpoint_versions", "writes"):
+                            cursor = self._conn.execute(
+                                f"DELETE FROM {table} WHERE thread_id=? AND checkpoint_ns=? AND checkpoint_id<?",
+                                (thread_id, ns, cutoff),
+                            )
+                            if table == "checkpoints":
+                                stats["checkpoints"] += cursor.rowcount
+
+                live = self._live_channel_values()
+                dead = [key for key in self._conn.execute(
+                    "SELECT thread_id, checkpoint_ns, channel, version FROM channel_values").fetchall()
+                    if key not in live]
+                self._conn.executemany(
+                    "DELETE FROM channel_values WHERE thread_id=? AND checkpoint_ns=? AND channel=? AND version=?", dead
+                )
+                stats["channel_values"] = len(dead)
+
+                referenced: Set[bytes] = set()
+                for kind, payload in self._conn.execute(
+                        "SELECT kind, payload FROM channel_values WHERE kind IN ('list', 'delta', 'dict')"):
+                    refs = ormsgpack.unpackb(payload)
+                    referenced.update(refs.values() if kind == "dict" else refs)
+                orphans = [(h,) for (h,) in self._conn.execute("SELECT hash FROM blobs") if h not in referenced]
+                self._conn.executemany("DELETE FROM blobs WHERE hash=?", orphans)
+                stats["blobs"] = len(orphans)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._last_lists.clear()
+            self._conn.execute("PRAGMA incremental_vacuum")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        metrics.inc("checkpoint.compactions")
+        metrics.inc("checkpoint.threads_expired", stats["threads"])
+        if any(stats.values()):
+            print(f"🗜️ checkpoint 压缩: 删除 {stats['threads']} 个过期会话、{stats['checkpoints']} 个 checkpoint、{stats['channel_values']} 个通道值、"
+                  f"{stats['blobs']} 个 blob，耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+        return stats
+
+    def _compact_loop(self) -> None:
+        while not self._stop.wait(self.compact_interval):
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"⚠️ checkpoint 压缩失败: {e!r}")
+
+    def close(self) -> None:
+        self._stop.set()
+        with self._lock:
+            self._conn.close()
+
+
+def create_checkpointer(path: str = CHECKPOINT_DB, thread_ttl: float = CHECKPOINT_THREAD_TTL) -> BaseCheckpointSaver:
+    """CHECKPOINT_DB 为空时退回 LangGraph 自带的内存 checkpointer"""
+    if not path:
+        from langgraph.checkpoint.memory import MemorySaver
+        return MemorySaver()
+    return DeltaCheckpointSaver(path, thread_ttl=thread_ttl)
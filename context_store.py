@@ -0,0 +1,67 @@
+import re
+import asyncio
+import threading
+from typing import Dict, Optional
+
+from metrics import metrics
+from prompts import content_hash
+from skill import get_skill_registry, SKILLS_DIR
+
+# ============================================================================
+# Skill 上下文共享存储：状态里只存内容哈希，正文在进程内只保留一份
+# ============================================================================
+# AgentState.skill_context 是 {skill_id: SKILL.md 内容哈希}，checkpoint 和状态快照里不再携带全文；
+# N 个会话加载同一个技能时共用同一个字符串。decision_node 构建 prompt 时再解析成正文。
+# 进程重启后从 checkpoint 恢复的哈希不在内存里，按 skill_id 重新读取 SKILL.md。
+
+_REF_RE = re.compile(r"^[0-9a-f]{40}$")
+
+
+class SkillContextStore:
+    def __init__(self, skills_dir: str = SKILLS_DIR):
+        self.skills_dir = skills_dir
+        self._texts: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def put(self, text: str) -> str:
+        """存入正文并返回引用；相同内容只保留第一次存入的字符串"""
+        ref = content_hash(text)
+        with self._lock:
+            self._texts.setdefault(ref, text)
+        return ref
+
+    def get(self, ref: str) -> Optional[str]:
+        return self._texts.get(ref)
+
+    def _load(self, skill_id: str, ref: str) -> str:
+        text = get_skill_registry(self.skills_dir).load_context(skill_id)
+        if self.put(text) != ref:
+            # 会话创建后 SKILL.md 被修改过，旧版本已不可得，使用当前内容
+            print(f"⚠️ 技能 {skill_id} 的上下文已更新，使用最新版本")
+            metrics.inc("skill_context.stale")
+        metrics.inc("skill_context.reloaded")
+        return text
+
+    def resolve(self, refs: Dict[str, str]) -> Dict[str, str]:
+        """{skill_id: 引用} -> {skill_id: 正文}"""
+        resolved = {}
+        for skill_id, ref in refs.items():
+            if not _REF_RE.match(ref):
+                # 旧 checkpoint 里直接存的是全文
+                resolved[skill_id] = self.get(self.put(ref))
+                continue
+            text = self.get(ref)
+            resolved[skill_id] = text if text is not None else self._load(skill_id, ref)
+        return resolved
+
+    async def aresolve(self, refs: Dict[str, str]) -> Dict[str, str]:
+        # 全部命中时直接在事件循环里返回，只有需要读盘时才切到线程
+        if all(ref in self._texts for ref in refs.values()):
+            return {skill_id: self._texts[ref] for skill_id, ref in refs.items()}
+        return await asyncio.to_thread(self.resolve, refs)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._texts), "chars": sum(len(t) for t in self._texts.values())}
+
+
+context_store = SkillContextStore()
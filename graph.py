@@ -17,7 +17,7 @@ from langgraph.graph import StateGraph, END, MessagesState
 
 from langchain_mcp_adapters.client import MultiServerMCPClient
 
-from nodes import decision_node, init_node, skill_node, tool_node, respond_node, route_after_decision
+from nodes import decision_node, init_node, skill_node, tool_node, respond_node, route_after_init, route_after_decision, route_after_skill
 from states import AgentState
 
 
@@ -35,7 +35,11 @@ def create_agent() -> StateGraph:
     graph.add_node("respond", respond_node)
 
     graph.set_entry_point("init")
-    graph.add_edge("init", "decision")
+    graph.add_conditional_edges(
+        "init",
+        route_after_init,
+        {"skill_node": "skill_node", "decision": "decision"}
+    )
 
     graph.add_conditional_edges(
         "decision",
@@ -43,7 +47,11 @@ def create_agent() -> StateGraph:
         {"skill_node": "skill_node", "tool_node": "tool_node", "respond": "respond"}
     )
 
-    graph.add_edge("skill_node", "decision")
+    graph.add_conditional_edges(
+        "skill_node",
+        route_after_skill,
+        {"tool_node": "tool_node", "decision": "decision"}
+    )
     graph.add_edge("tool_node", "decision")
     graph.add_edge("respond", END)
 
@@ -0,0 +1,127 @@
+import os
+from typing import Any, List, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from metrics import metrics
+from retrieval import estimate_tokens
+
+# ============================================================================
+# 对话历史窗口：最近几轮原样发送，更早的轮次折叠进滚动摘要
+# ============================================================================
+# decision_node 原本每次都发送完整历史，长会话的延迟和费用随轮数线性增长。
+# 这里按本地 token 估算划窗口：窗口超出 HISTORY_TOKEN_BUDGET 时，从最早的轮次开始折叠，
+# 直到窗口降到预算的 HISTORY_FOLD_TARGET 以下（留出余量，避免每轮都移动窗口、破坏前缀缓存）。
+# 折叠结果累加在 AgentState.history_summary 里，每次只处理新折叠的轮次，不重新计算。
+# 摘要是抽取式的（用户问题 + 调用的工具 + 最终回答），不额外调用 LLM。
+
+# 原样发送的历史消息 token 上限，<= 0 表示不折叠
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "6000"))
+# 折叠后窗口降到预算的多少比例
+HISTORY_FOLD_TARGET = float(os.environ.get("HISTORY_FOLD_TARGET", "0.6"))
+# 至少原样保留的最近轮数（当前轮总是完整保留）
+HISTORY_MIN_TURNS = int(os.environ.get("HISTORY_MIN_TURNS", "2"))
+# 滚动摘要的 token 上限，超出时丢弃最早的条目
+HISTORY_SUMMARY_TOKENS = int(os.environ.get("HISTORY_SUMMARY_TOKENS", "800"))
+
+_OMITTED_LINE = "- ……（更早的对话已省略）"
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in content)
+    return str(content)
+
+
+def message_tokens(msg: BaseMessage) -> int:
+    tokens = estimate_tokens(_text(msg.content)) + 4
+    for tc in getattr(msg, "tool_calls", None) or []:
+        tokens += estimate_tokens(tc["name"]) + estimate_tokens(str(tc.get("args", "")))
+    return tokens
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def turn_starts(messages: Sequence[BaseMessage], start: int = 0) -> List[int]:
+    """每轮以一条用户消息开始；工具调用和对应的 ToolMessage 总在同一轮里"""
+    return [i for i in range(start, len(messages)) if isinstance(messages[i], HumanMessage)]
+
+
+def summarize_turn(messages: Sequence[BaseMessage]) -> str:
+    """一轮对话的一行摘要"""
+    question, answer, tools = "", "", []
+    for msg in messages:
+        if isinstance(msg, HumanMessage) and not question:
+            question = _text(msg.content)
+        elif isinstance(msg, AIMessage):
+            for tc in msg.tool_calls:
+                if tc["name"] not in tools:
+                    tools.append(tc["name"])
+            if not msg.tool_calls and _text(msg.content).strip():
+                answer = _text(msg.content)
+    line = f"- 用户: {_clip(question, 120)}"
+    if tools:
+        line += f"；调用工具: {', '.join(tools)}"
+    if answer:
+        line += f"；回答: {_clip(answer, 160)}"
+    return line
+
+
+def _trim_summary(lines: List[str], max_tokens: int) -> List[str]:
+    if max_tokens <= 0:
+        return lines
+    total = sum(estimate_tokens(line) for line in lines)
+    dropped = False
+    while len(lines) > 1 and total > max_tokens:
+        total -= estimate_tokens(lines[0])
+        lines = lines[1:]
+        dropped = True
+    if dropped and lines[0] != _OMITTED_LINE:
+        lines = [_OMITTED_LINE] + lines
+    return lines
+
+
+def window(messages: Sequence[BaseMessage], summary: str = "", summarized: int = 0,
+           budget: int = HISTORY_TOKEN_BUDGET, min_turns: int = HISTORY_MIN_TURNS,
+           fold_target: float = HISTORY_FOLD_TARGET,
+           summary_tokens: int = HISTORY_SUMMARY_TOKENS) -> Tuple[List[BaseMessage], str, int]:
+    """
+    返回 (发给模型的消息, 新摘要, 已折叠的消息数)。
+    summarized 是上次折叠到的位置，之前的消息不再原样发送，也不再重复摘要。
+    """
+    if summarized and (summarized >= len(messages) or not isinstance(messages[summarized], HumanMessage)):
+        # 历史被改写过（或来自旧版本的状态），从头重新计算
+        summary, summarized = "", 0
+
+    start = summarized
+    keep_turns = max(1, min_turns)
+    starts = turn_starts(messages, start)
+    if budget > 0 and len(starts) > keep_turns:
+        sizes = [message_tokens(m) for m in messages[start:]]
+        total = sum(sizes)
+        if total > budget:
+            target = budget * fold_target
+            folded = []
+            # 第一条用户消息之前的残留消息并入第一轮；最后 keep_turns 轮不折叠
+            for end in starts[1:len(starts) - keep_turns + 1]:
+                if total <= target:
+                    break
+                folded.append(summarize_turn(messages[start:end]))
+                total -= sum(sizes[start - summarized:end - summarized])
+                start = end
+            lines = (summary.splitlines() if summary else []) + folded
+            summary = "\n".join(_trim_summary(lines, summary_tokens))
+            metrics.inc("history.folded_turns", len(folded))
+
+    return list(messages[start:]), summary, start
+
+
+def render_summary(summary: str) -> str:
+    if not summary:
+        return ""
+    return f"## 早前对话摘要\n{summary}\n"
@@ -14,9 +14,12 @@ import base64
 import math
 import uuid
 import time
+from collections import OrderedDict
 
 from dotenv import load_dotenv
 
+from tool_retrieval import tool_signature
+
 
 # def  get_llm():
 #     # 2. 创建LLM实例
@@ -44,12 +47,88 @@ from dotenv import load_dotenv
 LLM_MODEL = os.environ.get("LLM_MODEL", "qwen-plus")
 LLM_API_KEY = os.environ.get("LLM_API_KEY", "")
 LLM_BASE_URL = os.environ.get("LLM_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+# 长连接池参数
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE = int(os.environ.get("LLM_MAX_KEEPALIVE", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.environ.get("LLM_KEEPALIVE_EXPIRY", "90"))
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "120"))
+LLM_HTTP2 = os.environ.get("LLM_HTTP2", "").lower() in ("1", "true", "yes")
+# bind_tools 结果缓存的工具集个数
+BOUND_TOOLS_CACHE_SIZE = 32
 
+_llm = None
+_bound_llms = OrderedDict()  # 工具集指纹 -> 绑定好工具的 runnable
 
-def get_llm():
-    return ChatOpenAI(
-        model=LLM_MODEL,
-        api_key=LLM_API_KEY,
-        base_url=LLM_BASE_URL,
-        temperature=0
+
+def _http2_available() -> bool:
+    if not LLM_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        print("⚠️ LLM_HTTP2 已开启但未安装 h2，回退到 HTTP/1.1")
+        return False
+
+
+def _create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=_http2_available(),
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0),
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
     )
+
+
+def get_llm():
+    """进程内共享一个 ChatOpenAI 和它的连接池，避免每步都重新握手"""
+    global _llm
+    if _llm is None:
+        _llm = ChatOpenAI(
+            model=LLM_MODEL,
+            api_key=LLM_API_KEY,
+            base_url=LLM_BASE_URL,
+            temperature=0,
+            # decision_node 用 astream 调用，流式响应里也要带上 token 用量
+            stream_usage=True,
+            http_async_client=_create_http_client(),
+        )
+    return _llm
+
+
+def tools_fingerprint(tools) -> str:
+    # 按工具内容（名字、描述、参数 schema）计算，不用对象身份：
+    # 工具对象被回收后 id 可能被复用，会命中绑定着旧 schema 的缓存
+    digest = hashlib.sha1()
+    for t in tools:
+        digest.update(tool_signature(t).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def get_llm_with_tools(tools):
+    """按工具集指纹缓存 bind_tools 的结果，工具集不变时不再重复转换 JSON schema"""
+    key = tools_fingerprint(tools)
+    bound = _bound_llms.get(key)
+    if bound is not None:
+        _bound_llms.move_to_end(key)
+        return bound
+    bound = get_llm().bind_tools(tools)
+    _bound_llms[key] = bound
+    if len(_bound_llms) > BOUND_TOOLS_CACHE_SIZE:
+        _bound_llms.popitem(last=False)
+    return bound
+
+
+async def close_llm():
+    """关闭共享连接池（进程退出时调用）"""
+    global _llm
+    if _llm is not None:
+        client = getattr(_llm, "http_async_client", None)
+        _llm = None
+        _bound_llms.clear()
+        if client is not None:
+            await client.aclose()
@@ -0,0 +1,40 @@
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+from metrics import metrics
+
+# ============================================================================
+# 绑定事件循环的状态：换了循环时重建，旧循环上的资源显式关闭或放弃
+# ============================================================================
+# asyncio 的锁、信号量、连接都绑定创建它们的事件循环；多次 asyncio.run（CLI、批量脚本）时
+# 旧循环上的对象在新循环里不可用。调用方用 changed() 检测换循环、重建自己的状态，
+# 再把旧资源交给 release()：
+#   - 旧循环仍在运行（在其它线程里）：关闭操作提交到旧循环执行；
+#   - 旧循环已停止或关闭：无法再在上面清理，计数后放弃引用（应在循环结束前调用 shutdown / aclose）。
+
+
+class LoopGuard:
+    def __init__(self, name: str):
+        self.name = name
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._previous: Optional[asyncio.AbstractEventLoop] = None
+
+    def changed(self) -> bool:
+        """当前运行的循环与上次不同时返回 True（首次调用也返回 True）"""
+        loop = asyncio.get_running_loop()
+        if loop is self.loop:
+            return False
+        self._previous, self.loop = self.loop, loop
+        return True
+
+    def release(self, count: int, close: Callable[[], Awaitable[None]]) -> None:
+        """处理 changed() 之前那个循环上的 count 个资源；close 在旧循环上关闭它们"""
+        previous, self._previous = self._previous, None
+        if previous is None or not count:
+            return
+        if previous.is_running() and not previous.is_closed():
+            asyncio.run_coroutine_threadsafe(close(), previous)
+            metrics.inc(f"{self.name}.loop_closed", count)
+            return
+        print(f"⚠️ {self.name}: 事件循环已结束，放弃 {count} 个未关闭的资源（请在循环结束前调用 shutdown）")
+        metrics.inc(f"{self.name}.loop_abandoned", count)
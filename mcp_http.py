@@ -0,0 +1,168 @@
+import os
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from loop_guard import LoopGuard
+from metrics import metrics
+
+# ============================================================================
+# MCP HTTP 传输：按 origin 共享连接池
+# ============================================================================
+# MCP SDK 每建一个 session 就调用一次 httpx_client_factory，并在 session 结束时关闭 client。
+# 这里让每个 client 只是一层轻量外壳（headers / auth / 超时各自独立），底层连接池按
+# (origin, 连接参数) 共享，同一 MCP 主机的多个 session 复用 socket 和 TLS 会话。
+#
+# mcp_config.json 中每个 server 可以用 "http" 字段覆盖默认值，例如：
+#   "amap-maps": {"transport": "streamable_http", "url": "...",
+#                 "http": {"max_connections": 50, "http2": true, "read_timeout": 120}}
+
+MCP_HTTP_MAX_CONNECTIONS = int(os.environ.get("MCP_HTTP_MAX_CONNECTIONS", "20"))
+MCP_HTTP_MAX_KEEPALIVE = int(os.environ.get("MCP_HTTP_MAX_KEEPALIVE", "10"))
+MCP_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("MCP_HTTP_KEEPALIVE_EXPIRY", "90"))
+MCP_HTTP_CONNECT_TIMEOUT = float(os.environ.get("MCP_HTTP_CONNECT_TIMEOUT", "10"))
+MCP_HTTP2 = os.environ.get("MCP_HTTP2", "").lower() in ("1", "true", "yes")
+
+HTTP_TRANSPORTS = ("sse", "streamable_http")
+
+
+@dataclass(frozen=True)
+class HttpOptions:
+    max_connections: int = MCP_HTTP_MAX_CONNECTIONS
+    max_keepalive: int = MCP_HTTP_MAX_KEEPALIVE
+    keepalive_expiry: float = MCP_HTTP_KEEPALIVE_EXPIRY
+    http2: bool = MCP_HTTP2
+    verify: bool = True
+    connect_timeout: float = MCP_HTTP_CONNECT_TIMEOUT
+    # None 表示沿用 MCP SDK 传入的读超时（SSE 长连接默认 300 秒）
+    read_timeout: Optional[float] = None
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> "HttpOptions":
+        options = cls()
+        if not config:
+            return options
+        known = {k: v for k, v in config.items() if k in cls.__dataclass_fields__}
+        unknown = sorted(set(config) - set(known))
+        if unknown:
+            print(f"⚠️ 忽略未知的 MCP http 配置项: {unknown}")
+        return replace(options, **known)
+
+    def pool_key(self) -> Tuple:
+        # 只有影响连接本身的参数参与连接池划分，超时属于单个 client
+        return self.max_connections, self.max_keepalive, self.keepalive_expiry, self.http2, self.verify
+
+
+def _origin(url: str) -> str:
+    u = httpx.URL(url)
+    return f"{u.scheme}://{u.host}:{u.port or (443 if u.scheme == 'https' else 80)}"
+
+
+def _h2_installed() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class _SharedTransport(httpx.AsyncBaseTransport):
+    """转发到共享连接池；client 关闭时不关闭底层连接池"""
+
+    def __init__(self, transport: httpx.AsyncHTTPTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class _ClientFactory:
+    """
+    传给 MCP SDK 的 httpx_client_factory。
+    repr 固定为 origin + 参数，mcp_pool.config_key 据此区分不同配置。
+    """
+
+    def __init__(self, pool: "MCPHttpPool", origin: str, options: HttpOptions):
+        self._pool = pool
+        self.origin = origin
+        self.options = options
+
+    def __call__(self, headers: Optional[Dict[str, str]] = None, timeout: Optional[httpx.Timeout] = None,
+                 auth: Optional[httpx.Auth] = None) -> httpx.AsyncClient:
+        read = self.options.read_timeout
+        if read is None:
+            read = timeout.read if timeout is not None else 300.0
+        base = timeout.write if timeout is not None and timeout.write is not None else 30.0
+        return httpx.AsyncClient(
+            transport=_SharedTransport(self._pool.transport(self.origin, self.options)),
+            headers=headers,
+            auth=auth,
+            timeout=httpx.Timeout(base, connect=self.options.connect_timeout, read=read),
+        )
+
+    def __repr__(self) -> str:
+        return f"_ClientFactory({self.origin}, {self.options})"
+
+
+class MCPHttpPool:
+    def __init__(self):
+        self._transports: Dict[Tuple, httpx.AsyncHTTPTransport] = {}
+        self._guard = LoopGuard("mcp_http")
+
+    def transport(self, origin: str, options: HttpOptions) -> httpx.AsyncHTTPTransport:
+        # 连接池绑定事件循环；换了循环（如多次 asyncio.run）时旧连接池交给 LoopGuard 关闭或放弃
+        if self._guard.changed():
+            transports, self._transports = list(self._transports.values()), {}
+            self._guard.release(len(transports), lambda: _close_transports(transports))
+        key = (origin, options.pool_key())
+        transport = self._transports.get(key)
+        if transport is None:
+            http2 = options.http2 and _h2_installed()
+            if options.http2 and not http2:
+                print("⚠️ MCP http2 已开启但未安装 h2，回退到 HTTP/1.1")
+            transport = httpx.AsyncHTTPTransport(
+                verify=options.verify,
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=options.max_connections,
+                    max_keepalive_connections=options.max_keepalive,
+                    keepalive_expiry=options.keepalive_expiry,
+                ),
+            )
+            self._transports[key] = transport
+            metrics.inc("mcp_http.pools")
+        return transport
+
+    def configure(self, settings: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        把 server 配置里的 "http" 字段换成共享连接池的 httpx_client_factory。
+        已自带 httpx_client_factory 或非 HTTP 传输的配置原样返回（去掉 "http" 字段）。
+        """
+        settings = dict(settings)
+        options = HttpOptions.from_config(settings.pop("http", None))
+        if settings.get("transport") not in HTTP_TRANSPORTS or settings.get("httpx_client_factory"):
+            return settings
+        settings["httpx_client_factory"] = _ClientFactory(self, _origin(settings["url"]), options)
+        return settings
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pools": len(self._transports), "origins": sorted({k[0] for k in self._transports})}
+
+    async def aclose(self) -> None:
+        transports, self._transports = list(self._transports.values()), {}
+        await _close_transports(transports)
+
+
+async def _close_transports(transports: List[httpx.AsyncHTTPTransport]) -> None:
+    for transport in transports:
+        try:
+            await transport.aclose()
+        except Exception:
+            pass
+
+
+mcp_http_pool = MCPHttpPool()
@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import anyio
+import httpx
+from langchain_core.tools import BaseTool, StructuredTool
+from langchain_mcp_adapters.sessions import create_session
+from langchain_mcp_adapters.tools import load_mcp_tools
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
+
+from loop_guard import LoopGuard
+from metrics import metrics
+
+# ============================================================================
+# MCP 长连接池：按 server 配置哈希复用 session
+# ============================================================================
+
+# 空闲多久（秒）后关闭 session
+MCP_IDLE_TIMEOUT = float(os.environ.get("MCP_IDLE_TIMEOUT", "600"))
+# 距上次使用超过该时间（秒）再取用时先 ping 一次
+MCP_HEALTHCHECK_INTERVAL = float(os.environ.get("MCP_HEALTHCHECK_INTERVAL", "60"))
+# 建立连接 + 初始化 + 拉取工具列表的超时（秒）
+MCP_CONNECT_TIMEOUT = float(os.environ.get("MCP_CONNECT_TIMEOUT", "30"))
+
+# 这些异常说明连接本身坏了，重连后重试一次；其它异常（如工具参数错误）直接抛出
+_CONNECTION_ERRORS = (
+    OSError,
+    httpx.TransportError,
+    anyio.ClosedResourceError,
+    anyio.BrokenResourceError,
+    anyio.EndOfStream,
+)
+# streamable_http 客户端在服务端丢失会话（如服务重启后返回 404）时使用的错误码
+_SESSION_TERMINATED = 32600
+
+
+def _is_connection_error(e: BaseException) -> bool:
+    if isinstance(e, _CONNECTION_ERRORS):
+        return True
+    return isinstance(e, McpError) and e.error.code in (CONNECTION_CLOSED, _SESSION_TERMINATED)
+
+
+def config_key(server_name: str, connection: Dict[str, Any]) -> str:
+    """server 配置的哈希；配置里的可调用对象（如 httpx_client_factory）按限定名参与哈希"""
+    payload = json.dumps(
+        {"name": server_name, "connection": connection},
+        sort_keys=True,
+        default=lambda o: getattr(o, "__qualname__", repr(o)),
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def tool_schema(tool: BaseTool) -> Dict[str, Any]:
+    """把 MCP 工具转成可持久化的 schema（与 list_tools 的字段对应）"""
+    schema = tool.args_schema
+    if not isinstance(schema, dict):
+        schema = tool.get_input_schema().model_json_schema()
+    return {
+        "name": tool.name,
+        "description": tool.description or "",
+        "input_schema": schema,
+        "metadata": tool.metadata,
+    }
+
+
+class PooledSession:
+    """
+    一个长期存活的 MCP ClientSession。
+    session 的上下文管理器必须在同一个 task 里进入和退出，所以由后台 task 持有，
+    close() 时通知该 task 退出。
+    """
+
+    def __init__(self, key: str, server_name: str, connection: Dict[str, Any]):
+        self.key = key
+        self.server_name = server_name
+        self.connection = connection
+        self.session = None
+        self.server_version = ""
+        self.tools: Dict[str, BaseTool] = {}
+        self.last_used = time.monotonic()
+        self.last_checked = self.last_used
+        self._task: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Event] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.session is not None and self._task is not None and not self._task.done()
+
+    async def _hold(self, ready: asyncio.Event) -> None:
+        async with create_session(self.connection) as session:
+            result = await session.initialize()
+            self.server_version = getattr(result.serverInfo, "version", "") or ""
+            tools = await load_mcp_tools(session, server_name=self.server_name)
+            self.tools = {t.name: t for t in tools}
+            self.session = session
+            ready.set()
+            await self._closing.wait()
+
+    async def open(self) -> None:
+        ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task = asyncio.create_task(self._hold(ready), name=f"mcp-session:{self.server_name}")
+        # 连接中途断开时 _hold 会带着异常结束，这里取走异常，下次 acquire 发现 alive=False 后重连
+        self._task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        waiter = asyncio.create_task(ready.wait())
+        try:
+            done, _ = await asyncio.wait(
+                {waiter, self._task}, timeout=MCP_CONNECT_TIMEOUT, return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            waiter.cancel()
+        if self._task in done:
+            # _hold 提前结束说明连接失败，把异常抛给调用方
+            self._task.result()
+            raise ConnectionError(f"MCP server {self.server_name} closed during initialization")
+        if not ready.is_set():
+            await self.close()
+            raise TimeoutError(f"MCP server {self.server_name} connect timed out after {MCP_CONNECT_TIMEOUT:g}s")
+        metrics.inc("mcp.connects")
+
+    async def ping(self) -> bool:
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout=10)
+        except Exception:
+            return False
+        self.last_checked = time.monotonic()
+        return True
+
+    def touch(self) -> None:
+        self.last_used = time.monotonic()
+
+    async def close(self) -> None:
+        if self._closing is not None:
+            self._closing.set()
+        task, self._task = self._task, None
+        self.session = None
+        if task is not None and not task.done():
+            try:
+                await asyncio.wait_for(task, timeout=5)
+            except BaseException:
+                task.cancel()
+
+
+class MCPSessionPool:
+    def __init__(self):
+        self._sessions: Dict[str, PooledSession] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        self._guard = LoopGuard("mcp_pool")
+
+    def _check_loop(self) -> None:
+        # session 和锁都绑定事件循环；换了循环（如多次 asyncio.run）时旧 session 交给 LoopGuard 关闭或放弃
+        if not self._guard.changed():
+            return
+        sessions, reaper = list(self._sessions.values()), self._reaper
+        self._sessions, self._locks, self._reaper = {}, {}, None
+
+        async def close_old() -> None:
+            if reaper is not None:
+                reaper.cancel()
+            for pooled in sessions:
+                await pooled.close()
+
+        self._guard.release(len(sessions), close_old)
+
+    async def acquire(self, server_name: str, connection: Dict[str, Any]) -> PooledSession:
+        """取一个可用的 session：复用现有连接，必要时做健康检查或重连"""
+        self._check_loop()
+        key = config_key(server_name, connection)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            pooled = self._sessions.get(key)
+            if pooled is not None and pooled.alive:
+                if time.monotonic() - pooled.last_checked < MCP_HEALTHCHECK_INTERVAL or await pooled.ping():
+                    pooled.touch()
+                    metrics.inc("mcp.session_reuse")
+                    return pooled
+                print(f"⚠️ MCP server {server_name} 健康检查失败，重新连接")
+            if pooled is not None:
+                await pooled.close()
+                self._sessions.pop(key, None)
+
+            pooled = PooledSession(key, server_name, connection)
+            await pooled.open()
+            self._sessions[key] = pooled
+            self._ensure_reaper()
+            return pooled
+
+    async def discard(self, pooled: PooledSession) -> None:
+        if self._sessions.get(pooled.key) is pooled:
+            self._sessions.pop(pooled.key, None)
+        await pooled.close()
+
+    async def fetch_schemas(self, server_name: str, connection: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
+        """连接（或复用连接）并返回 (server 版本, 工具 schema 列表)"""
+        pooled = await self.acquire(server_name, connection)
+        return pooled.server_version, [tool_schema(t) for t in pooled.tools.values()]
+
+    async def get_tools(self, server_name: str, connection: Dict[str, Any]) -> List[BaseTool]:
+        """返回代理工具：每次调用都从池里取当前 session，连接断开时自动重连并重试一次"""
+        _, schemas = await self.fetch_schemas(server_name, connection)
+        return self.build_tools(server_name, connection, schemas)
+
+    def build_tools(self, server_name: str, connection: Dict[str, Any],
+                    schemas: List[Dict[str, Any]]) -> List[BaseTool]:
+        """按 schema 构建代理工具，不建立连接；首次调用时才连接 server"""
+        return [self._proxy_tool(server_name, connection, schema) for schema in schemas]
+
+    @staticmethod
+    async def _call(pooled: PooledSession, tool_name: str, arguments: Dict[str, Any]):
+        tool = pooled.tools.get(tool_name)
+        if tool is None:
+            # 缓存的 schema 比 server 实际提供的工具旧
+            raise ValueError(f"MCP server {pooled.server_name} 不再提供工具 {tool_name}")
+        return await tool.coroutine(**arguments)
+
+    def _proxy_tool(self, server_name: str, connection: Dict[str, Any], schema: Dict[str, Any]) -> BaseTool:
+        tool_name = schema["name"]
+
+        async def call_tool(**arguments: Any):
+            pooled = await self.acquire(server_name, connection)
+            try:
+                return await self._call(pooled, tool_name, arguments)
+            except Exception as e:
+                if not _is_connection_error(e):
+                    raise
+                print(f"⚠️ MCP 工具 {tool_name} 连接异常（{e!r}），重连后重试")
+                metrics.inc("mcp.reconnects")
+                await self.discard(pooled)
+                pooled = await self.acquire(server_name, connection)
+                return await self._call(pooled, tool_name, arguments)
+
+        return StructuredTool(
+            name=tool_name,
+            description=schema.get("description", ""),
+            args_schema=schema.get("input_schema") or {"type": "object", "properties": {}},
+            coroutine=call_tool,
+            response_format="content_and_artifact",
+            metadata=schema.get("metadata"),
+        )
+
+    def _ensure_reaper(self) -> None:
+        if MCP_IDLE_TIMEOUT > 0 and (self._reaper is None or self._reaper.done()):
+            self._reaper = asyncio.create_task(self._reap_idle(), name="mcp-session-reaper")
+
+    async def _reap_idle(self) -> None:
+        interval = max(1.0, min(60.0, MCP_IDLE_TIMEOUT / 2))
+        while self._sessions:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for key, pooled in list(self._sessions.items()):
+                lock = self._locks.get(key)
+                if now - pooled.last_used < MCP_IDLE_TIMEOUT or (lock is not None and lock.locked()):
+                    continue
+                print(f"💤 关闭空闲 MCP 连接: {pooled.server_name}")
+                metrics.inc("mcp.idle_evictions")
+                await self.discard(pooled)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self._sessions),
+            "servers": sorted(p.server_name for p in self._sessions.values()),
+        }
+
+    async def close(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        sessions, self._sessions = list(self._sessions.values()), {}
+        for pooled in sessions:
+            await pooled.close()
+
+
+mcp_pool = MCPSessionPool()
@@ -0,0 +1,101 @@
+import os
+import json
+import time
+import threading
+from typing import Any, Dict, List, Optional
+
+from metrics import metrics
+
+# ============================================================================
+# MCP 工具 schema 磁盘缓存
+# ============================================================================
+# 按 server 配置哈希保存 list_tools 的结果和 server 版本，加载 skill 时直接用缓存构建工具，
+# 不需要先连上 server；真正调用工具时才建立连接，过期的 schema 在后台刷新。
+
+# 缓存文件路径，设为空字符串表示不使用磁盘缓存
+MCP_SCHEMA_CACHE_PATH = os.environ.get("MCP_SCHEMA_CACHE_PATH", "./.mcp_schema_cache.json")
+# schema 超过该时间（秒）视为过期，下次加载时后台刷新
+MCP_SCHEMA_TTL = float(os.environ.get("MCP_SCHEMA_TTL", "3600"))
+SCHEMA_CACHE_VERSION = 1
+
+
+class MCPSchemaCache:
+    """
+    {config_key: {"server_name", "server_version", "fetched_at", "tools": [schema, ...]}}
+    配置变化会得到新的 config_key；server 升级后刷新时按 server_version 判断是否替换。
+    """
+
+    def __init__(self, path: str = MCP_SCHEMA_CACHE_PATH, ttl: float = MCP_SCHEMA_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def _load_locked(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is not None:
+            return self._entries
+        self._entries = {}
+        if not self.path:
+            return self._entries
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return self._entries
+        if isinstance(data, dict) and data.get("version") == SCHEMA_CACHE_VERSION:
+            self._entries = data.get("servers") or {}
+        return self._entries
+
+    def _save_locked(self) -> None:
+        if not self.path:
+            return
+        data = {"version": SCHEMA_CACHE_VERSION, "servers": self._entries}
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except (OSError, TypeError, ValueError):
+            # 只读文件系统或 schema 无法序列化时只保留内存缓存
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._load_locked().get(key)
+        metrics.inc("mcp_schema.hits" if entry is not None else "mcp_schema.misses")
+        return entry
+
+    def is_stale(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry.get("fetched_at", 0) >= self.ttl
+
+    def put(self, key: str, server_name: str, server_version: str, tools: List[Dict[str, Any]]) -> bool:
+        """写入最新 schema，返回工具列表或 server 版本是否有变化"""
+        with self._lock:
+            entries = self._load_locked()
+            old = entries.get(key)
+            changed = old is None or old.get("server_version") != server_version or old.get("tools") != tools
+            entries[key] = {
+                "server_name": server_name,
+                "server_version": server_version,
+                "fetched_at": time.time(),
+                "tools": tools,
+            }
+            self._save_locked()
+        if changed and old is not None:
+            metrics.inc("mcp_schema.changed")
+        return changed
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        with self._lock:
+            entries = self._load_locked()
+            if key is None:
+                entries.clear()
+            else:
+                entries.pop(key, None)
+            self._save_locked()
+
+
+mcp_schema_cache = MCPSchemaCache()
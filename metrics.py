@@ -0,0 +1,41 @@
+import threading
+from typing import Dict
+
+# ============================================================================
+# 进程内计数器
+# ============================================================================
+
+
+class Counters:
+    """线程安全的简单计数器，供各模块埋点，统一导出"""
+
+    def __init__(self):
+        self._values: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + value
+
+    def get(self, name: str) -> float:
+        return self._values.get(name, 0)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(sorted(self._values.items()))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+metrics = Counters()
+
+
+def render_prometheus(values: Dict[str, float], prefix: str = "skill_agent") -> str:
+    """按 Prometheus 文本格式导出，指标名中的 . 和 - 换成 _"""
+    lines = []
+    for name, value in sorted(values.items()):
+        metric = f"{prefix}_{name}".replace(".", "_").replace("-", "_")
+        lines.append(f"{metric} {int(value) if float(value).is_integer() else value}")
+    return "\n".join(lines) + "\n"
@@ -1,135 +1,270 @@
 
-import json
+import os
+import asyncio
 from typing import Literal
-from langchain_core.messages import AIMessage, ToolMessage, SystemMessage
-from llm2 import get_llm
+from langchain_core.messages import AIMessage, ToolMessage, SystemMessage, HumanMessage
+from llm2 import get_llm_with_tools
 from mcp_manager import get_current_tools, BASE_TOOL_NAMES, mcp_manager
-from skill import get_skills_prompt, SKILLS_DIR, find_skill_for_tool, scan_skills, load_skill_context
+from skill import get_relevant_skills_prompt, SKILLS_DIR, find_skill_for_tool, scan_skills, load_skill_context
+from prompts import build_system_prompt, record_usage
+from tool_runtime import tool_runner
+from tool_retrieval import tool_ranker, TOOLS_RECENT_TURNS
+from context_store import context_store
+from history import window as history_window
+from streaming import holding_writer, stream_decision
+from tools import LOAD_SKILL_TOOL
+from metrics import metrics
 from states import AgentState
 
 
+# 技能加载后直接重放 decision 暂存的工具调用，校验失败才回到 LLM 重新决策
+REPLAY_PENDING_TOOL_CALLS = os.environ.get("REPLAY_PENDING_TOOL_CALLS", "1").lower() not in ("0", "false", "no")
+
+_JSON_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "array": list,
+    "object": dict,
+}
+
+
 # ============================================================================
 # 节点
 # ============================================================================
 
+def _latest_user_text(messages) -> str:
+    """取最近一条用户消息的文本，用于检索相关 skill"""
+    for msg in reversed(messages):
+        if isinstance(msg, HumanMessage):
+            return msg.content if isinstance(msg.content, str) else str(msg.content)
+    return ""
+
+
+def _recent_conversation_text(messages, limit: int = 6) -> str:
+    """最近几条消息的文本，用于给 skill 章节排序"""
+    parts = []
+    for msg in list(messages)[-limit:]:
+        if isinstance(msg.content, str) and msg.content:
+            parts.append(msg.content)
+    return "\n".join(parts)
+
+
+def _recent_tool_names(messages, turns: int = TOOLS_RECENT_TURNS) -> set:
+    """最近几轮 AI 工具调用里用过的工具名"""
+    names = set()
+    for msg in reversed(messages):
+        if turns <= 0:
+            break
+        if isinstance(msg, AIMessage) and msg.tool_calls:
+            names.update(tc["name"] for tc in msg.tool_calls)
+            turns -= 1
+    return names
+
+
+def _validate_tool_args(tool, args) -> bool:
+    """按工具的参数 schema 校验调用参数：pydantic 模型直接校验，JSON schema 检查必填项和基本类型"""
+    if not isinstance(args, dict):
+        return False
+    schema = tool.args_schema
+    if schema is None:
+        return True
+    if hasattr(schema, "model_validate"):
+        try:
+            schema.model_validate(args)
+            return True
+        except Exception:
+            return False
+    if not isinstance(schema, dict):
+        return True
+
+    properties = schema.get("properties", {})
+    if any(name not in args for name in schema.get("required", [])):
+        return False
+    if schema.get("additionalProperties") is False and any(name not in properties for name in args):
+        return False
+    for name, value in args.items():
+        prop = properties.get(name)
+        if isinstance(prop, dict) and not _matches_json_type(value, prop.get("type")):
+            return False
+    return True
+
+
+def _matches_json_type(value, json_type) -> bool:
+    """JSON schema 的 type 可以是字符串或字符串列表（联合类型）；不认识的类型一律放行"""
+    if isinstance(json_type, list):
+        return not json_type or any(_matches_json_type(value, t) for t in json_type)
+    if json_type == "null":
+        return value is None
+    expected = _JSON_TYPES.get(json_type) if isinstance(json_type, str) else None
+    if expected is None or value is None:
+        return True
+    if isinstance(value, bool) and expected is not bool:
+        return False
+    return isinstance(value, expected)
+
+
+def _replayable_tool_calls(tool_calls: list) -> list:
+    """暂存的工具调用全部能在当前工具集中找到且参数合法时返回它们，否则返回空列表"""
+    if not tool_calls:
+        return []
+    tools_by_name = {t.name: t for t in get_current_tools()}
+    for tc in tool_calls:
+        tool = tools_by_name.get(tc["name"])
+        if tool is None or not _validate_tool_args(tool, tc.get("args")):
+            print(f"⚠️ 暂存的工具调用 {tc['name']} 校验失败，交回 LLM 重新决策")
+            return []
+    return tool_calls
+
+
+def _requested_skills(tool_call: dict) -> list:
+    """load_skill 调用里的 skill_ids，兼容模型只传一个字符串"""
+    skill_ids = (tool_call.get("args") or {}).get("skill_ids") or []
+    return [skill_ids] if isinstance(skill_ids, str) else [s for s in skill_ids if isinstance(s, str)]
+
+
+def _skill_ready(skill_id: str, skills_info: dict) -> bool:
+    """技能可以直接使用：没有 MCP 配置，或它的工具已在本进程的 mcp_manager 里"""
+    info = skills_info.get(skill_id)
+    if info is None:
+        return False
+    if not (info.get("has_mcp") and info.get("mcp_config_path")):
+        return True
+    return mcp_manager.is_skill_loaded(skill_id)
+
+
+def _unanswered_tool_calls(messages) -> list:
+    """最近一条 AI 消息里还没有对应 ToolMessage 的工具调用"""
+    answered = set()
+    for msg in reversed(messages):
+        if isinstance(msg, ToolMessage):
+            answered.add(msg.tool_call_id)
+        elif isinstance(msg, AIMessage):
+            return [tc for tc in msg.tool_calls if tc["id"] not in answered]
+        else:
+            break
+    return []
+
+
 async def init_node(state: AgentState) -> dict:
+    # 带 checkpointer 的多轮会话保留已加载的技能，新会话从空开始
+    available = state.get("available_skills") or []
+    required = []
+    if available:
+        # 进程重启后从 checkpoint 恢复的技能，MCP 工具不在本进程里，先经 skill_node 重新加载；
+        # 已不存在的技能直接丢弃
+        skills_info = await scan_skills(SKILLS_DIR)
+        required = [s for s in available if s in skills_info and not _skill_ready(s, skills_info)]
+        available = [s for s in available if _skill_ready(s, skills_info)]
+        if required:
+            print(f"♻️ 恢复会话，重新加载技能: {required}")
     return {
-        "available_skills": [],
-        "skill_context": {},
-        "required_skills": [],
+        "available_skills": available,
+        "skill_context": state.get("skill_context") or {},
+        "required_skills": required,
         "task_complete": False,
-        "pending_tool_calls": []
+        "pending_tool_calls": [],
+        "history_summary": state.get("history_summary") or "",
+        "summarized_messages": state.get("summarized_messages") or 0,
     }
 
 
 async def decision_node(state: AgentState) -> dict:
-    llm = get_llm()
-    skills_prompt = await get_skills_prompt(SKILLS_DIR)
-
-    loaded_skills = state.get("available_skills", [])
-    loaded_context = ""
-    if state.get("skill_context"):
-        loaded_context = "\n\n<loaded_skill_contexts>\n"
-        for skill_id, ctx in state["skill_context"].items():
-            loaded_context += f"### {skill_id}\n{ctx}\n\n"
-        loaded_context += "</loaded_skill_contexts>"
-
-    current_tools = get_current_tools()
-    tool_names = [t.name for t in current_tools]
-
-    # 根据是否有已加载的技能调整提示
-    if loaded_skills:
-        action_hint = f"""## 用户当前用的是macos，请将用户体验拉到最好
-        ## 已加载的技能
-{loaded_skills}
-
-## 当前可用工具
-{tool_names}
+    # 只绑定最近用过的技能的工具，超出技能数或 token 预算的技能本轮卸载
+    loaded_skills, evicted_skills = mcp_manager.select_skills(state.get("available_skills", []))
+    skill_refs = {k: v for k, v in (state.get("skill_context") or {}).items() if k in loaded_skills}
+    skill_context = await context_store.aresolve(skill_refs)
+    if evicted_skills:
+        print(f"🧹 卸载空闲技能: {evicted_skills}")
+
+    skills_prompt = await get_relevant_skills_prompt(
+        _latest_user_text(state["messages"]), SKILLS_DIR, include=loaded_skills
+    )
 
-**重要：技能已加载完成！现在请直接调用工具完成任务，不要再输出 LOAD_SKILL！**
+    # prompt 里列出全部已加载工具的名字，但只绑定与对话相关的工具 schema
+    loaded_tools = mcp_manager.get_tools_for_skills(loaded_skills)
+    conversation = _recent_conversation_text(state["messages"])
+    current_tools = tool_ranker.select(
+        loaded_tools, conversation, _recent_tool_names(state["messages"]), skill_context, pinned=BASE_TOOL_NAMES
+    )
+    # 最近几轮原样发送，更早的轮次折叠进摘要
+    history, summary, summarized = history_window(
+        state["messages"], state.get("history_summary") or "", state.get("summarized_messages") or 0
+    )
+    system_msg = build_system_prompt(
+        skills_prompt,
+        skill_context,
+        conversation,
+        loaded_skills,
+        [t.name for t in loaded_tools],
+        summary,
+    )
 
-直接使用工具调用来完成用户的请求。"""
+    messages = [SystemMessage(content=system_msg)] + history
+    # 流式生成：调用未加载的工具时立即取消剩余生成，文本实时转发给调用方
+    loaded_by_name = {t.name: t for t in loaded_tools}
+
+    def needs_skill(name: str) -> bool:
+        return name not in loaded_by_name
+
+    # 模型点名调用被裁剪的工具时这次结果可能要重试：之前的文本照常转发，之后的输出先暂存
+    bound_tool_names = {t.name for t in current_tools}
+
+    def is_pruned(name: str) -> bool:
+        return name in loaded_by_name and name not in bound_tool_names
+
+    writer = holding_writer()
+    response = await stream_decision(get_llm_with_tools(current_tools), messages, needs_skill, writer, is_pruned)
+    record_usage(response)
+
+    # 模型点名调用了被裁剪的工具：参数能通过校验就直接执行，否则绑定全部工具重新决策
+    pruned_calls = [tc for tc in response.tool_calls if is_pruned(tc["name"])]
+    if pruned_calls and not all(_validate_tool_args(loaded_by_name[tc["name"]], tc.get("args")) for tc in pruned_calls):
+        print(f"🔁 调用了未绑定的工具 {[tc['name'] for tc in pruned_calls]}，绑定全部工具后重试")
+        metrics.inc("tools.rebind_all")
+        current_tools = loaded_tools
+        # 通知调用方丢弃这次已经转发的文本
+        writer.reset()
+        response = await stream_decision(get_llm_with_tools(current_tools), messages, needs_skill, writer)
+        record_usage(response)
     else:
-        action_hint = f"""## 当前可用工具
-{tool_names}
-
-## 决策流程
-1. 如果需要使用某个 skill 的 MCP 工具，先输出：
-   ```json
-   {{"action": "LOAD_SKILL", "skill_ids": ["skill_id"]}}
-   ```
-2. 如果工具已在可用列表中，直接调用工具。
-3. 任务完成时直接回复。"""
-
-    system_msg = f"""你是一个智能助手，可以使用工具和技能。请用中文回复。
-
-{skills_prompt}
-{loaded_context}
-
-{action_hint}
-"""
-
-    llm_with_tools = llm.bind_tools(current_tools)
-    messages = [SystemMessage(content=system_msg)] + list(state["messages"])
-    response = await llm_with_tools.ainvoke(messages)
+        writer.flush()
 
     result = {"messages": [response], "required_skills": [], "pending_tool_calls": []}
-
-    # 检查 LOAD_SKILL 指令（只有在技能未加载时才处理）
-    loaded_skills = state.get("available_skills", [])
-    if response.content and "LOAD_SKILL" in response.content:
-        try:
-            import re
-            json_match = re.search(r'\{[^{}]*"action"\s*:\s*"LOAD_SKILL"[^{}]*\}', response.content)
-            if json_match:
-                action_data = json.loads(json_match.group())
-                skill_ids = action_data.get("skill_ids", [])
-                # 过滤掉已加载的技能
-                new_skill_ids = [s for s in skill_ids if s not in loaded_skills]
-                if new_skill_ids:
-                    result["required_skills"] = new_skill_ids
-                    result["task_complete"] = False
-                    return result
-                # 如果全都已加载，添加提示让 LLM 直接用工具
-                print(f"⚠️ 技能 {skill_ids} 已全部加载，强制 LLM 使用工具")
-                # 替换消息，提示 LLM 工具已可用
-                force_msg = AIMessage(
-                    content=f"技能已加载，现在可用的工具有: {[t.name for t in get_current_tools()]}。请直接调用工具完成任务。"
-                )
-                result["messages"] = [force_msg]
-                result["task_complete"] = False
-                return result
-        except:
-            pass
-
-    # 检查工具调用
+    if summarized != (state.get("summarized_messages") or 0):
+        result["history_summary"] = summary
+        result["summarized_messages"] = summarized
+    if evicted_skills:
+        result["available_skills"] = loaded_skills
+        result["skill_context"] = skill_refs
+
+    # 检查工具调用：load_skill 和需要先加载技能的工具调用在同一轮处理，加载后直接重放
     if response.tool_calls:
-        missing_skills = []
-        valid_tool_calls = []
+        skills_info = await scan_skills(SKILLS_DIR)
+        required_skills = []
+        pending_calls = []
 
         for tc in response.tool_calls:
             tool_name = tc["name"]
-            # 检查工具是否存在
-            if tool_name in BASE_TOOL_NAMES or mcp_manager.is_tool_loaded(tool_name):
-                valid_tool_calls.append(tc)
+            if tool_name == LOAD_SKILL_TOOL:
+                # 不存在的技能留给 load_skill 工具本身返回错误
+                skill_ids = [s for s in _requested_skills(tc) if s in skills_info and s not in loaded_skills]
+            elif tool_name in loaded_by_name:
+                continue
             else:
-                # 工具不存在，找对应的 skill
-                skill_id = await find_skill_for_tool(tool_name, SKILLS_DIR)
-                if skill_id and skill_id not in missing_skills:
-                    missing_skills.append(skill_id)
-                    print(f"⚠️ 工具 {tool_name} 未加载，需要先加载 skill: {skill_id}")
-
-        if missing_skills:
-            # 需要先加载 skill
-            result["required_skills"] = missing_skills
-            result["pending_tool_calls"] = response.tool_calls  # 保存待执行的调用
-            result["task_complete"] = False
-
-            # 添加提示消息
-            hint_msg = AIMessage(content=f"我需要先加载技能 {missing_skills} 才能使用相关工具。")
-            result["messages"] = [hint_msg]
-            return result
-
+                # 工具不存在或所属技能已被卸载，找对应的 skill 重新加载
+                skill_id = mcp_manager.get_skill_for_tool(tool_name) or await find_skill_for_tool(tool_name, SKILLS_DIR)
+                if not skill_id or skill_id in loaded_skills:
+                    continue
+                pending_calls.append(tc)
+                skill_ids = [skill_id]
+                print(f"⚠️ 工具 {tool_name} 未加载，需要先加载 skill: {skill_id}")
+            required_skills.extend(s for s in skill_ids if s not in required_skills)
+
+        if required_skills:
+            result["required_skills"] = required_skills
+            result["pending_tool_calls"] = pending_calls  # 技能加载后重放
         result["task_complete"] = False
     else:
         result["task_complete"] = True
@@ -145,76 +280,105 @@ async def skill_node(state: AgentState) -> dict:
     if not new_skills:
         return {}
 
-    new_context = {}
     skills_info = await scan_skills(SKILLS_DIR)
-    loaded_mcp_tools = []
-
-    for skill_id in new_skills:
-        context = await load_skill_context(skill_id, SKILLS_DIR)
-        new_context[skill_id] = context
-        print(f"📖 加载技能上下文: {skill_id}")
 
+    async def load_one(skill_id: str):
         skill_info = skills_info.get(skill_id, {})
+        mcp_tools = []
         if skill_info.get("has_mcp") and skill_info.get("mcp_config_path"):
-            mcp_tools = await mcp_manager.load_skill_mcp_tools(
-                skill_id, skill_info["mcp_config_path"]
-            )
-            if mcp_tools:
-                loaded_mcp_tools.extend([t.name for t in mcp_tools])
-
-    tools_msg = f" 可用工具: {loaded_mcp_tools}" if loaded_mcp_tools else ""
-    skill_loaded_msg = AIMessage(
-        content=f"✅ 已加载技能: {', '.join(new_skills)}.{tools_msg}"
+            mcp_tools = await mcp_manager.load_skill_mcp_tools(skill_id, skill_info["mcp_config_path"])
+        return mcp_tools
+
+    # 所有技能的上下文和 MCP 工具并发加载，总耗时取决于最慢的一个
+    contexts, tool_results = await asyncio.gather(
+        asyncio.gather(*(load_skill_context(s, SKILLS_DIR) for s in new_skills)),
+        asyncio.gather(*(load_one(s) for s in new_skills), return_exceptions=True),
     )
 
+    # MCP 工具全部加载失败的技能不算已加载，下次 load_skill 会重新尝试
+    ok_skills = []
+    new_context = {}
+    loaded_mcp_tools = []
+    failures = []
+    failed = []
+    for skill_id, context, mcp_tools in zip(new_skills, contexts, tool_results):
+        errors = mcp_manager.get_load_errors(skill_id)
+        detail = ", ".join(f"{k}: {v}" for k, v in errors.items())
+        if isinstance(mcp_tools, BaseException):
+            failed.append(f"{skill_id}({mcp_tools})")
+            continue
+        if not _skill_ready(skill_id, skills_info):
+            failed.append(f"{skill_id}({detail or '没有可用的 MCP 工具'})")
+            continue
+        ok_skills.append(skill_id)
+        new_context[skill_id] = context_store.put(context)
+        print(f"📖 加载技能上下文: {skill_id}")
+        loaded_mcp_tools.extend([t.name for t in mcp_tools])
+        if errors:
+            failures.append(f"{skill_id}({detail})")
+
+    lines = []
+    if ok_skills:
+        tools_msg = f" 可用工具: {loaded_mcp_tools}" if loaded_mcp_tools else ""
+        lines.append(f"✅ 已加载技能: {', '.join(ok_skills)}.{tools_msg}")
+    if failures:
+        lines.append(f"⚠️ 部分 MCP 工具加载失败: {'; '.join(failures)}")
+    if failed:
+        lines.append(f"❌ 技能加载失败，未加载: {'; '.join(failed)}。可以稍后再次调用 load_skill 重试")
+
+    # 加载结果作为 load_skill 调用的返回值；模型直接调用了未加载工具时只打印
+    last_msg = state["messages"][-1] if state.get("messages") else None
+    load_calls = [tc for tc in getattr(last_msg, "tool_calls", None) or [] if tc["name"] == LOAD_SKILL_TOOL]
+    unknown = [s for tc in load_calls for s in _requested_skills(tc) if s not in skills_info]
+    if unknown:
+        lines.append(f"⚠️ 未找到技能: {unknown}")
+    content = "\n".join(lines)
+    replies = [ToolMessage(content=content, tool_call_id=tc["id"], name=LOAD_SKILL_TOOL) for tc in load_calls]
+    if not load_calls:
+        print(content)
+
+    # 工具已就绪：暂存的调用留给 tool_node 直接执行，省掉一次 LLM 往返；不能重放时回复错误，交回 LLM 重新决策
+    pending = state.get("pending_tool_calls", [])
+    replay = _replayable_tool_calls(pending) if REPLAY_PENDING_TOOL_CALLS else []
+    if replay:
+        print(f"🔁 重放工具调用: {[tc['name'] for tc in replay]}")
+    else:
+        replies.extend(
+            ToolMessage(content=f"Skill loaded. Call {tc['name']} again with valid arguments."
+                        if mcp_manager.is_tool_loaded(tc["name"])
+                        else f"Tool {tc['name']} is unavailable: its skill failed to load.",
+                        tool_call_id=tc["id"], name=tc["name"])
+            for tc in pending
+        )
+
     return {
-        "available_skills": loaded + new_skills,
+        "available_skills": loaded + ok_skills,
         "skill_context": {**state.get("skill_context", {}), **new_context},
         "required_skills": [],
-        "messages": [skill_loaded_msg],
-        "pending_tool_calls": []  # 清空，回到 decision 重新决策
+        "messages": replies,
+        "pending_tool_calls": []
     }
 
 
 async def tool_node(state: AgentState) -> dict:
-    """异步执行工具调用"""
+    """并发执行最近一条 AI 消息里尚未得到结果的工具调用，结果按调用顺序返回"""
     current_tools = get_current_tools()
     tools_by_name = {t.name: t for t in current_tools}
 
-    messages = state.get("messages", [])
-    last_msg = messages[-1] if messages else None
-
-    if not isinstance(last_msg, AIMessage) or not last_msg.tool_calls:
+    tool_calls = _unanswered_tool_calls(state.get("messages", []))
+    if not tool_calls:
         return {}
 
-    tool_messages = []
-    for tc in last_msg.tool_calls:
-        tool_name = tc["name"]
-        tool_args = tc["args"]
-        tool_id = tc["id"]
-
-        tool = tools_by_name.get(tool_name)
-        if not tool:
-            tool_messages.append(ToolMessage(
-                content=f"Error: Tool '{tool_name}' not found.",
-                tool_call_id=tool_id
-            ))
-            continue
-
-        try:
-            # 使用异步调用
-            result = await tool.ainvoke(tool_args)
-            tool_messages.append(ToolMessage(
-                content=str(result),
-                tool_call_id=tool_id
-            ))
-        except Exception as e:
-            tool_messages.append(ToolMessage(
-                content=f"Error: {e}",
-                tool_call_id=tool_id
-            ))
+    tool_messages = await tool_runner.run(tool_calls, tools_by_name)
+    result = {"messages": tool_messages}
 
-    return {"messages": tool_messages}
+    # 用到的技能移到末尾，available_skills 保持按最近使用排序，供 decision 做 LRU 卸载
+    skills = state.get("available_skills", [])
+    used = [s for s in dict.fromkeys(mcp_manager.get_skill_for_tool(tc["name"]) for tc in tool_calls)
+            if s in skills]
+    if used:
+        result["available_skills"] = [s for s in skills if s not in used] + used
+    return result
 
 
 async def respond_node(state: AgentState) -> dict:
@@ -225,6 +389,11 @@ async def respond_node(state: AgentState) -> dict:
 # 路由
 # ============================================================================
 
+def route_after_init(state: AgentState) -> Literal["skill_node", "decision"]:
+    # 恢复的会话有技能需要重新加载时先去 skill_node
+    return "skill_node" if state.get("required_skills") else "decision"
+
+
 def route_after_decision(state: AgentState) -> Literal["skill_node", "tool_node", "respond"]:
     # 优先加载 skill
     required = state.get("required_skills", [])
@@ -243,3 +412,10 @@ def route_after_decision(state: AgentState) -> Literal["skill_node", "tool_node"
 
     return "respond"
 
+
+def route_after_skill(state: AgentState) -> Literal["tool_node", "decision"]:
+    # 还有未执行的工具调用（重放的调用、同一回复里已加载工具的调用）时直接执行，否则回到 decision
+    if _unanswered_tool_calls(state.get("messages", [])):
+        return "tool_node"
+    return "decision"
+
@@ -0,0 +1,121 @@
+import hashlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List
+
+from history import render_summary
+from metrics import metrics
+from skill_context import budget_skill_context
+
+# ============================================================================
+# System prompt：字节稳定的前缀 + 可变后缀
+# ============================================================================
+# 前缀的最前面是与会话无关的固定指令和决策规则，所有请求共享，便于 DashScope / OpenAI 兼容接口
+# 命中前缀缓存；随问题变化的 skill 目录紧随其后，已加载上下文、工具列表等放在后缀。
+
+SYSTEM_INSTRUCTIONS = "你是一个智能助手，可以使用工具和技能。请用中文回复。"
+
+DECISION_RULES = """## 决策流程
+1. 如果需要使用某个 skill 的 MCP 工具而它尚未加载，调用 load_skill 工具（skill_ids 填 skill id）。
+   如果已经确定要调用该 skill 的哪个工具及参数，在同一次回复里同时发出 load_skill 和这个工具调用。
+2. 如果工具已在可用列表中，直接调用工具。
+3. 任务完成时直接回复。"""
+
+# 固定部分只依赖常量，进程内只拼接一次
+PROMPT_PREFIX = f"{SYSTEM_INSTRUCTIONS}\n\n{DECISION_RULES}\n"
+
+PROMPT_MEMO_SIZE = 256
+
+
+def content_hash(*parts: str) -> str:
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class _Memo:
+    """按内容哈希缓存渲染结果的 LRU"""
+
+    def __init__(self, name: str, size: int = PROMPT_MEMO_SIZE):
+        self.name = name
+        self.size = size
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+
+    def get_or_render(self, key: str, render: Callable[[], str]) -> str:
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+            metrics.inc(f"prompt.{self.name}.reuse")
+            return value
+        metrics.inc(f"prompt.{self.name}.render")
+        value = render()
+        self._items[key] = value
+        if len(self._items) > self.size:
+            self._items.popitem(last=False)
+        return value
+
+
+_prefix_memo = _Memo("prefix")
+
+
+def build_prefix(skills_prompt: str) -> str:
+    # 固定指令在最前面，skill 目录随问题检索结果变化，放在固定部分之后；
+    # 同样的 skill 目录返回同一个字符串，prompt.prefix.reuse / render 反映前缀的复用情况
+    return _prefix_memo.get_or_render(
+        content_hash(skills_prompt),
+        lambda: f"{PROMPT_PREFIX}\n{skills_prompt}\n",
+    )
+
+
+def build_loaded_contexts(skill_context: Dict[str, str], conversation: str) -> str:
+    # 章节裁剪取决于当前对话，每轮都会变化，不做缓存
+    if not skill_context:
+        return ""
+    lines = ["<loaded_skill_contexts>"]
+    for skill_id in sorted(skill_context):
+        ctx, omitted = budget_skill_context(skill_context[skill_id], conversation)
+        lines.append(f"### {skill_id}\n{ctx}\n")
+        if omitted:
+            lines.append(
+                f"（未展开章节: {omitted}，需要时调用 read_skill_section(\"{skill_id}\", 章节标题) 获取）\n"
+            )
+    lines.append("</loaded_skill_contexts>")
+    return "\n".join(lines)
+
+
+def build_suffix(loaded_context: str, loaded_skills: List[str], tool_names: List[str]) -> str:
+    parts = []
+    if loaded_context:
+        parts.append(loaded_context)
+    if loaded_skills:
+        parts.append(f"""## 用户当前用的是macos，请将用户体验拉到最好
+## 已加载的技能
+{sorted(loaded_skills)}
+
+**重要：技能已加载完成！现在请直接调用工具完成任务，不要再调用 load_skill！**
+直接使用工具调用来完成用户的请求。""")
+    parts.append(f"## 当前可用工具\n{sorted(tool_names)}")
+    return "\n\n".join(parts) + "\n"
+
+
+def build_system_prompt(skills_prompt: str, skill_context: Dict[str, str], conversation: str,
+                        loaded_skills: List[str], tool_names: List[str], history_summary: str = "") -> str:
+    prefix = build_prefix(skills_prompt)
+    suffix = build_suffix(build_loaded_contexts(skill_context, conversation), loaded_skills, tool_names)
+    if history_summary:
+        # 摘要只在折叠时变化，放在最后不影响前面部分的前缀缓存
+        suffix += f"\n{render_summary(history_summary)}"
+    return f"{prefix}\n{suffix}"
+
+
+def record_usage(response: Any) -> None:
+    """从响应的 usage_metadata 中累计输入 token 和命中前缀缓存的 token"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    if not usage:
+        return
+    metrics.inc("llm.calls")
+    metrics.inc("llm.input_tokens", usage.get("input_tokens", 0))
+    metrics.inc("llm.output_tokens", usage.get("output_tokens", 0))
+    details = usage.get("input_token_details") or {}
+    metrics.inc("llm.cached_tokens", details.get("cache_read", 0) or 0)
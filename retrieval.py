@@ -0,0 +1,86 @@
+import math
+import re
+from typing import Dict, List, Iterable, Tuple
+
+# ============================================================================
+# 本地词法检索（BM25 + 字符 n-gram，无需向量服务）
+# ============================================================================
+
+_WORD_RE = re.compile(r"[0-9a-z]+|[\u3400-\u9fff\uf900-\ufaff]+")
+_CJK_RE = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+
+
+def estimate_tokens(text: str) -> int:
+    """本地粗略估算 token 数：中文字符按 1 token，其余按 4 字符 1 token"""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    英文/数字按单词切分并附带字符 trigram；中文连续片段切成字符 bigram，
+    单字片段保留 unigram，这样中文查询不依赖分词器也能命中。
+    """
+    tokens = []
+    for piece in _WORD_RE.findall(text.lower()):
+        if piece[0].isascii():
+            if len(piece) > 1:
+                tokens.append(piece)
+            # 英文单词额外加入字符 trigram，容忍词形变化（remind / reminders）
+            if len(piece) > 3 and not piece.isdigit():
+                tokens.extend("#" + piece[i:i + 3] for i in range(len(piece) - 2))
+            continue
+        if len(piece) == 1:
+            tokens.append(piece)
+            continue
+        for i in range(len(piece) - 1):
+            tokens.append(piece[i:i + 2])
+    return tokens
+
+
+class BM25Index:
+    """基于倒排表的 BM25，查询只遍历命中词项的 posting list"""
+
+    def __init__(self, docs: Dict[str, List[str]], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, List[Tuple[str, int]]] = {}
+        self._doc_len: Dict[str, int] = {}
+
+        for doc_id in sorted(docs):
+            tokens = docs[doc_id]
+            self._doc_len[doc_id] = len(tokens)
+            counts: Dict[str, int] = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, tf in counts.items():
+                self._postings.setdefault(token, []).append((doc_id, tf))
+
+        n = len(self._doc_len)
+        self._avg_len = (sum(self._doc_len.values()) / n) if n else 0.0
+        self._idf = {
+            token: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for token, postings in self._postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def score(self, query_tokens: Iterable[str]) -> Dict[str, float]:
+        scores: Dict[str, float] = {}
+        avg_len = self._avg_len or 1.0
+        for token in set(query_tokens):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = self._idf[token]
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query: str, top_k: int) -> List[Tuple[str, float]]:
+        """返回 [(doc_id, score)]，按分数降序，同分按 doc_id 排序"""
+        scores = self.score(tokenize(query))
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:top_k]
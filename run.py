@@ -3,6 +3,8 @@ import asyncio
 from langchain_core.messages import AIMessage, HumanMessage
 from graph import create_agent
 from mcp_manager import mcp_manager
+from llm2 import close_llm
+from tool_runtime import tool_runner
 
 graph = create_agent().compile()
 
@@ -11,24 +13,55 @@ graph = create_agent().compile()
 # CLI
 # ============================================================================
 
+def final_answer(result: dict) -> str:
+    """取最后一条不带工具调用的 AI 回复"""
+    for msg in reversed(result["messages"]):
+        if isinstance(msg, AIMessage) and msg.content and not msg.tool_calls:
+            return msg.content
+    return ""
+
+
 async def run_agent(message: str):
     print(f"\n{'='*60}\n🎯 Task: {message}\n{'='*60}")
-    try:
-        result = await graph.ainvoke({"messages": [HumanMessage(content=message)]})
+    # 模型输出边生成边打印；流式输出过的回答不再重复打印
+    result, streamed, current = None, "", ""
+    async for mode, chunk in graph.astream({"messages": [HumanMessage(content=message)]},
+                                           stream_mode=["custom", "values"]):
+        if mode == "values":
+            result = chunk
+        elif chunk.get("type") == "token":
+            if not current:
+                print("\n💬 ", end="")
+            current += chunk["text"]
+            print(chunk["text"], end="", flush=True)
+        elif chunk.get("type") == "end":
+            print()
+            streamed, current = current, ""
+        elif chunk.get("type") == "reset":
+            # 这次决策被丢弃重试，已打印的文本作废
+            if current:
+                print("\n↩️ 重新生成...")
+            current = ""
+    answer = final_answer(result)
+    if answer and answer.strip() != streamed.strip():
         print(f"\n{'='*60}\n📤 RESULT:\n{'='*60}")
-        for msg in reversed(result["messages"]):
-            if isinstance(msg, AIMessage) and msg.content and not msg.tool_calls:
-                print(msg.content)
-                break
-        return result
+        print(answer)
+    return result
+
+
+async def _run_cli(message: str):
+    try:
+        await run_agent(message)
     finally:
-        await mcp_manager.cleanup()
+        await mcp_manager.shutdown()
+        await close_llm()
+        tool_runner.shutdown()
 
 
 def main():
     import sys
     query = " ".join(sys.argv[1:]) if len(sys.argv) > 1 else "明天北京天气如何"
-    asyncio.run(run_agent(query))
+    asyncio.run(_run_cli(query))
 
 
 if __name__ == "__main__":
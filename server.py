@@ -0,0 +1,360 @@
+import os
+import json
+import time
+import uuid
+import signal
+import asyncio
+from contextlib import aclosing, nullcontext
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple, Union
+
+from langchain_core.messages import HumanMessage
+
+from checkpointer import create_checkpointer
+from context_store import context_store
+from graph import create_agent
+from llm2 import get_llm, close_llm
+from mcp_http import mcp_http_pool
+from mcp_manager import mcp_manager
+from mcp_pool import mcp_pool
+from metrics import metrics, render_prometheus
+from run import final_answer
+from skill import get_skill_registry, SKILLS_DIR
+from tool_cache import tool_cache
+from tool_runtime import tool_runner
+
+# ============================================================================
+# 常驻服务：图只编译一次，skill 目录、MCP 连接、LLM 连接池和工具缓存跨请求保持
+# ============================================================================
+#   python server.py                      # HTTP，默认 127.0.0.1:8080
+#   python server.py --unix /tmp/agent.sock
+#
+#   POST /run      {"message": "...", "session_id": "可选，多轮对话共用", "stream": false}
+#                  stream 为 true 时返回 SSE：token 事件逐段推送模型输出，最后一个 result 事件；
+#                  reset 事件表示这段输出被丢弃重新生成，客户端应清空之前收到的 token
+#   GET  /metrics  Prometheus 文本格式
+#   GET  /health
+
+SERVER_HOST = os.environ.get("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.environ.get("SERVER_PORT", "8080"))
+# 同时执行的请求数上限，超出的请求排队
+SERVER_MAX_CONCURRENCY = int(os.environ.get("SERVER_MAX_CONCURRENCY", "32"))
+# 单个请求的超时（秒）
+SERVER_REQUEST_TIMEOUT = float(os.environ.get("SERVER_REQUEST_TIMEOUT", "300"))
+# 请求体大小上限（字节）
+SERVER_MAX_BODY = int(os.environ.get("SERVER_MAX_BODY", str(1024 * 1024)))
+# 收到退出信号后等待进行中请求完成的时间（秒）
+SERVER_SHUTDOWN_GRACE = float(os.environ.get("SERVER_SHUTDOWN_GRACE", "30"))
+# 多轮会话空闲多久（秒）后丢弃；checkpoint 文件里之前进程留下的会话按同样的时间过期
+SERVER_SESSION_TTL = float(os.environ.get("SERVER_SESSION_TTL", "3600"))
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+            504: "Gateway Timeout"}
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class AgentServer:
+    def __init__(self, max_concurrency: int = SERVER_MAX_CONCURRENCY,
+                 request_timeout: float = SERVER_REQUEST_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        # 单次请求不需要保存状态；带 session_id 的请求走带 checkpointer 的图
+        self.graph = create_agent().compile()
+        # CHECKPOINT_DB 非空时会话状态增量写入 SQLite，服务重启后可继续
+        self.checkpointer = create_checkpointer(thread_ttl=SERVER_SESSION_TTL)
+        self.session_graph = create_agent().compile(checkpointer=self.checkpointer)
+        self._sessions: Dict[str, float] = {}  # session_id -> 最近使用时间
+        # 同一会话的请求串行执行，避免并发请求基于同一个 checkpoint 各自写入、互相覆盖
+        self._session_locks: Dict[str, asyncio.Lock] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._inflight = 0
+        self._idle: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._reaper: Optional[asyncio.Task] = None
+
+    # ------------------------------------------------------------------ 生命周期
+
+    async def warm_up(self) -> None:
+        """启动时预热：扫描 skill 目录、建立 LLM 连接池"""
+        start = time.perf_counter()
+        registry = get_skill_registry(SKILLS_DIR)
+        await asyncio.to_thread(registry.refresh)
+        get_llm()
+        print(f"🔥 预热完成: {len(registry.get_skills())} 个技能, 耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    async def start(self, host: str = SERVER_HOST, port: int = SERVER_PORT, unix_path: Optional[str] = None) -> None:
+        self._semaphore = asyncio.Semaphore(max(1, self.max_concurrency))
+        self._idle = asyncio.Event()
+        self._idle.set()
+        await self.warm_up()
+        if unix_path:
+            if os.path.exists(unix_path):
+                os.remove(unix_path)
+            self._server = await asyncio.start_unix_server(self._handle_connection, path=unix_path)
+            print(f"🚀 服务已启动: unix:{unix_path}")
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, host, port)
+            print(f"🚀 服务已启动: http://{host}:{port}")
+        if SERVER_SESSION_TTL > 0:
+            self._reaper = asyncio.create_task(self._reap_sessions())
+
+    async def shutdown(self) -> None:
+        """停止接收新连接，等待进行中的请求完成后释放 MCP 连接、LLM 连接池和线程池"""
+        if self._stopping:
+            return
+        self._stopping = True
+        print("🛑 正在关闭服务...")
+        if self._server is not None:
+            self._server.close()
+        if self._reaper is not None:
+            self._reaper.cancel()
+        if self._inflight:
+            print(f"⏳ 等待 {self._inflight} 个进行中的请求")
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=SERVER_SHUTDOWN_GRACE)
+            except asyncio.TimeoutError:
+                print("⚠️ 等待超时，强制关闭")
+        await mcp_manager.shutdown()
+        await close_llm()
+        tool_runner.shutdown()
+        if hasattr(self.checkpointer, "close"):
+            self.checkpointer.close()
+        print("👋 服务已关闭")
+
+    async def _reap_sessions(self) -> None:
+        interval = max(1.0, min(60.0, SERVER_SESSION_TTL / 2))
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for session_id, last_used in list(self._sessions.items()):
+                lock = self._session_locks.get(session_id)
+                if now - last_used >= SERVER_SESSION_TTL and not (lock and lock.locked()):
+                    self._sessions.pop(session_id, None)
+                    self._session_locks.pop(session_id, None)
+                    await self.checkpointer.adelete_thread(session_id)
+                    metrics.inc("server.sessions_expired")
+
+    # ------------------------------------------------------------------ 业务
+
+    @staticmethod
+    async def _stream(graph, inputs: Dict[str, Any], config: Optional[Dict[str, Any]],
+                      on_event: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+        result = None
+        async for mode, chunk in graph.astream(inputs, config, stream_mode=["custom", "values"]):
+            if mode == "values":
+                result = chunk
+            elif chunk.get("type") in ("token", "reset"):
+                on_event(chunk)
+        return result
+
+    async def run(self, message: str, session_id: Optional[str] = None,
+                  on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """执行一次请求；传入 on_event 时模型输出（token / reset 事件）逐段回调"""
+        start = time.perf_counter()
+        inputs = {"messages": [HumanMessage(content=message)]}
+        # 先排会话锁再占并发名额，排队中的同会话请求不占用名额
+        session_lock = nullcontext()
+        if session_id:
+            self._sessions[session_id] = time.monotonic()
+            session_lock = self._session_locks.setdefault(session_id, asyncio.Lock())
+        async with session_lock, self._semaphore:
+            self._inflight += 1
+            self._idle.clear()
+            try:
+                graph, config = self.graph, None
+                if session_id:
+                    self._sessions[session_id] = time.monotonic()
+                    graph, config = self.session_graph, {"configurable": {"thread_id": session_id}}
+                execution = self._stream(graph, inputs, config, on_event) if on_event else graph.ainvoke(inputs, config)
+                result = await asyncio.wait_for(execution, self.request_timeout)
+            except asyncio.TimeoutError:
+                metrics.inc("server.timeouts")
+                raise HTTPError(504, f"request timed out after {self.request_timeout:g}s")
+            finally:
+                self._inflight -= 1
+                if not self._inflight:
+                    self._idle.set()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        metrics.inc("server.request_ms", elapsed_ms)
+        return {"answer": final_answer(result), "session_id": session_id, "elapsed_ms": round(elapsed_ms, 1)}
+
+    def metrics_text(self) -> str:
+        values = metrics.snapshot()
+        values.update({
+            "server.inflight": self._inflight,
+            "server.sessions": len(self._sessions),
+            "mcp.sessions_open": mcp_pool.stats()["sessions"],
+            "mcp_http.pools_open": mcp_http_pool.stats()["pools"],
+            "tool_cache.entries": tool_cache.stats()["entries"],
+            "tool_cache.bytes": tool_cache.stats()["bytes"],
+            "skill_context.entries": context_store.stats()["entries"],
+            "skill_context.chars": context_store.stats()["chars"],
+        })
+        return render_prometheus(values)
+
+    # ------------------------------------------------------------------ HTTP
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, str, Union[bytes, AsyncIterator[bytes]]]:
+        path = path.split("?", 1)[0]
+        if path == "/health":
+            status = 503 if self._stopping else 200
+            return status, "application/json", json.dumps({"ok": not self._stopping}).encode()
+        if path == "/metrics":
+            return 200, "text/plain; version=0.0.4", self.metrics_text().encode()
+        if path != "/run":
+            raise HTTPError(404, f"unknown path {path}")
+        if method != "POST":
+            raise HTTPError(405, "use POST")
+        if self._stopping:
+            raise HTTPError(503, "server is shutting down")
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise HTTPError(400, "body must be JSON")
+        message = payload.get("message") if isinstance(payload, dict) else None
+        if not isinstance(message, str) or not message.strip():
+            raise HTTPError(400, "'message' is required")
+        session_id = payload.get("session_id")
+        if session_id is not None and not isinstance(session_id, str):
+            raise HTTPError(400, "'session_id' must be a string")
+        if payload.get("new_session"):
+            session_id = uuid.uuid4().hex
+        if payload.get("stream"):
+            return 200, "text/event-stream", self._sse(message, session_id)
+        result = await self.run(message, session_id)
+        return 200, "application/json", json.dumps(result, ensure_ascii=False).encode()
+
+    async def _sse(self, message: str, session_id: Optional[str]) -> AsyncIterator[bytes]:
+        """SSE：模型输出逐段发送 token（及 reset）事件，结束时发送 result（或 error）事件"""
+        queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue()
+        task = asyncio.create_task(self.run(message, session_id, on_event=queue.put_nowait))
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (event := await queue.get()) is not None:
+                if event["type"] == "token":
+                    yield _sse_event("token", {"text": event["text"]})
+                else:
+                    yield _sse_event("reset", {})
+            try:
+                yield _sse_event("result", task.result())
+            except HTTPError as e:
+                yield _sse_event("error", {"error": str(e), "status": e.status})
+            except Exception as e:
+                metrics.inc("server.errors")
+                yield _sse_event("error", {"error": str(e), "status": 500})
+        finally:
+            # 客户端提前断开时取消执行
+            task.cancel()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "malformed request line")
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        raw_length = headers.get("content-length") or "0"
+        # 只接受十进制非负整数；出错时请求体边界未知，连接随后关闭
+        if not raw_length.isascii() or not raw_length.isdigit():
+            raise HTTPError(400, f"invalid Content-Length: {raw_length!r}")
+        length = int(raw_length)
+        if length > SERVER_MAX_BODY:
+            raise HTTPError(413, f"body larger than {SERVER_MAX_BODY} bytes")
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path, headers, body
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # HTTP/1.1 keep-alive：同一连接上顺序处理多个请求
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                    metrics.inc("server.requests")
+                    status, content_type, payload = await self._dispatch(method, path, body)
+                except HTTPError as e:
+                    status, content_type = e.status, "application/json"
+                    payload = json.dumps({"error": str(e)}, ensure_ascii=False).encode()
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    metrics.inc("server.errors")
+                    print(f"❌ 请求处理失败: {e!r}")
+                    status, content_type = 500, "application/json"
+                    payload = json.dumps({"error": str(e)}, ensure_ascii=False).encode()
+                keep_alive = keep_alive and not self._stopping
+                head = (f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+                        f"Content-Type: {content_type}\r\n"
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n")
+                if isinstance(payload, bytes):
+                    writer.write(f"{head}Content-Length: {len(payload)}\r\n\r\n".encode("latin-1") + payload)
+                    await writer.drain()
+                else:
+                    # 流式响应用 chunked 编码，连接仍可复用
+                    writer.write(f"{head}Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\n\r\n".encode("latin-1"))
+                    async with aclosing(payload):
+                        async for data in payload:
+                            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+                            await writer.drain()
+                    writer.write(b"0\r\n\r\n")
+                    await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host: str = SERVER_HOST, port: int = SERVER_PORT, unix_path: Optional[str] = None) -> None:
+    server = AgentServer()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+    await server.start(host, port, unix_path)
+    try:
+        await stop.wait()
+    finally:
+        await server.shutdown()
+        if unix_path and os.path.exists(unix_path):
+            os.remove(unix_path)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="skills-agent 常驻服务")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--unix", dest="unix_path", help="监听 Unix socket 而不是 TCP 端口")
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port, args.unix_path))
+
+
+if __name__ == "__main__":
+    main()
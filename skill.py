@@ -1,9 +1,15 @@
 
 import os
+import re
 import json
 import asyncio
+import hashlib
+import threading
+import time
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
+
+from retrieval import BM25Index, tokenize
 
 # ============================================================================
 # Skill 扫描（同步 + 异步包装）
@@ -11,61 +17,444 @@ from typing import Dict, Any, Optional
 
 
 SKILLS_DIR = os.environ.get("SKILLS_DIR", "./skills")
+# 两次文件系统校验之间的最小间隔（秒），间隔内直接复用内存中的目录
+SKILLS_RECHECK_INTERVAL = float(os.environ.get("SKILLS_RECHECK_INTERVAL", "1.0"))
+# 决策 prompt 中最多列出的相关 skill 数，<= 0 表示列出全部
+SKILLS_TOP_K = int(os.environ.get("SKILLS_TOP_K", "8"))
+# 编译后的 skill 目录快照，进程冷启动时一次读入；为空时放在 SKILLS_DIR 旁边
+SKILLS_CATALOG_PATH = os.environ.get("SKILLS_CATALOG_PATH", "")
+CATALOG_VERSION = 1
+# 扫描时读取 SKILL.md 头部的字符上限；正文只在 load_skill_context 时读取
+FRONTMATTER_MAX_CHARS = 16 * 1024
+# 没有 frontmatter 时，从开头这么多字符里提取第一段作为描述
+DESCRIPTION_FALLBACK_CHARS = 1024
 
-def _scan_skills_sync(skills_dir: str) -> Dict[str, Dict[str, Any]]:
-    skills_path = Path(skills_dir)
-    skills = {}
-    if not skills_path.exists():
-        return skills
 
-    for skill_dir in skills_path.iterdir():
-        if not skill_dir.is_dir():
+def _default_catalog_path(skills_dir: str) -> str:
+    if SKILLS_CATALOG_PATH:
+        return SKILLS_CATALOG_PATH
+    path = Path(os.path.abspath(skills_dir))
+    return str(path.parent / f".{path.name}_catalog.json")
+
+
+def _as_tuple(value: Any) -> Any:
+    """JSON 里的指纹是嵌套 list，转回 tuple 以便和 _stat_key 的结果比较"""
+    if isinstance(value, list):
+        return tuple(_as_tuple(v) for v in value)
+    return value
+
+
+def _stat_key(path: Path) -> Optional[Tuple[int, int]]:
+    """返回 (mtime_ns, size)，文件不存在时返回 None"""
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _parse_scalar(value: str) -> Any:
+    value = value.strip()
+    if not value:
+        return ""
+    if value[0] in "{[" or value[0] == '"':
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+        return value[1:-1]
+    return value
+
+
+def _parse_frontmatter(text: str) -> Dict[str, Any]:
+    """
+    解析 SKILL.md 开头 `---` 包裹的 frontmatter。
+    只支持 skill 里实际出现的写法：顶层 `key: value`、`- item` 列表和单行 JSON，
+    不依赖 yaml（部分 description 里带未加引号的冒号，严格 YAML 会解析失败）。
+    """
+    lines = text.splitlines()
+    if not lines or lines[0].strip() != "---":
+        return {}
+
+    meta: Dict[str, Any] = {}
+    current_key = None
+    for line in lines[1:]:
+        if line.strip() == "---":
+            break
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
             continue
-        skill_id = skill_dir.name
-        skill_md = skill_dir / "SKILL.md"
-        mcp_config = skill_dir / "mcp_config.json"
-
-        skill_info = {
-            "id": skill_id,
-            "path": str(skill_dir),
-            "has_skill_md": skill_md.exists(),
-            "has_mcp": mcp_config.exists(),
-            "skill_md_path": str(skill_md) if skill_md.exists() else None,
-            "mcp_config_path": str(mcp_config) if mcp_config.exists() else None,
-            "mcp_tool_names": []
-        }
+        if stripped.startswith("- ") and current_key:
+            if not isinstance(meta.get(current_key), list):
+                meta[current_key] = []
+            meta[current_key].append(_parse_scalar(stripped[2:]))
+            continue
+        if line[0].isspace() or ":" not in stripped:
+            continue
+        key, _, value = stripped.partition(":")
+        current_key = key.strip()
+        meta[current_key] = _parse_scalar(value)
+    return meta
+
+
+def _read_skill_header(skill_md: Path) -> str:
+    """只读取 SKILL.md 的 frontmatter 块（有上限）；没有 frontmatter 时读取开头一小段"""
+    with open(skill_md, 'r', encoding='utf-8') as f:
+        first = f.readline(FRONTMATTER_MAX_CHARS)
+        if first.strip() != "---":
+            return first + f.read(max(0, DESCRIPTION_FALLBACK_CHARS - len(first)))
+
+        chunks = [first]
+        budget = FRONTMATTER_MAX_CHARS - len(first)
+        while budget > 0:
+            line = f.readline(budget)
+            if not line:
+                break
+            chunks.append(line)
+            budget -= len(line)
+            if line.strip() == "---":
+                break
+        return "".join(chunks)
+
+
+def _first_paragraph(text: str) -> str:
+    """无 frontmatter 的 SKILL.md：取第一个非标题段落作为描述"""
+    para = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            if para:
+                break
+            continue
+        if stripped.startswith("#"):
+            if para:
+                break
+            continue
+        para.append(stripped)
+    return " ".join(para)
+
+
+def _extract_requires(metadata: Any) -> Dict[str, Any]:
+    """metadata.requires，兼容 {"openclaw": {"requires": ...}} 这种带命名空间的写法"""
+    if not isinstance(metadata, dict):
+        return {}
+    if isinstance(metadata.get("requires"), dict):
+        return metadata["requires"]
+    for value in metadata.values():
+        if isinstance(value, dict) and isinstance(value.get("requires"), dict):
+            return value["requires"]
+    return {}
+
 
-        # 读取 MCP 配置中的工具名（用于匹配）
-        if mcp_config.exists():
+def _scan_skill_dir(skill_dir: Path) -> Dict[str, Any]:
+    """解析单个 skill 目录"""
+    skill_id = skill_dir.name
+    skill_md = skill_dir / "SKILL.md"
+    mcp_config = skill_dir / "mcp_config.json"
+
+    skill_info = {
+        "id": skill_id,
+        "path": str(skill_dir),
+        "has_skill_md": skill_md.exists(),
+        "has_mcp": mcp_config.exists(),
+        "skill_md_path": str(skill_md) if skill_md.exists() else None,
+        "mcp_config_path": str(mcp_config) if mcp_config.exists() else None,
+        "mcp_tool_names": []
+    }
+
+    digest = hashlib.sha1()
+
+    # 读取 MCP 配置中的工具名（用于匹配）
+    if mcp_config.exists():
+        try:
+            with open(mcp_config, 'r', encoding='utf-8') as f:
+                raw = f.read()
+            digest.update(raw.encode('utf-8'))
+            cfg = json.loads(raw)
+            # 从 mcpServers 的 key 推断工具名前缀
+            for server_name in cfg.get("mcpServers", {}).keys():
+                skill_info["mcp_tool_names"].append(server_name)
+        except:
+            pass
+
+    if skill_md.exists():
+        try:
+            header = _read_skill_header(skill_md)
+            digest.update(header.encode('utf-8'))
+            meta = _parse_frontmatter(header)
+            skill_info["name"] = str(meta.get("name") or skill_id)
+            skill_info["description"] = str(meta.get("description") or "") if meta else _first_paragraph(header)
+            tags = meta.get("tags") or []
+            skill_info["tags"] = [str(t) for t in tags] if isinstance(tags, list) else [str(tags)]
             try:
-                with open(mcp_config, 'r', encoding='utf-8') as f:
-                    cfg = json.load(f)
-                    # 从 mcpServers 的 key 推断工具名前缀
-                    for server_name in cfg.get("mcpServers", {}).keys():
-                        skill_info["mcp_tool_names"].append(server_name)
-            except:
-                pass
+                skill_info["priority"] = int(meta.get("priority") or 0)
+            except (TypeError, ValueError):
+                skill_info["priority"] = 0
+            skill_info["requires"] = _extract_requires(meta.get("metadata"))
+        except:
+            pass
+
+    skill_info["content_hash"] = digest.hexdigest()
+    skill_info["prompt_line"] = _render_skill_line(skill_id, skill_info)
+    return skill_info
+
+
+def _skill_search_tokens(info: Dict[str, Any]) -> List[str]:
+    """检索用文本：name 和 tags 加权，description 原样"""
+    name_tokens = tokenize(f"{info['id']} {info.get('name', '')}")
+    tag_tokens = tokenize(" ".join(info.get("tags", [])))
+    return name_tokens * 3 + tag_tokens * 2 + tokenize(info.get("description", ""))
+
+
+# ============================================================================
+# SkillRegistry：进程级缓存，按 mtime/size 增量失效
+# ============================================================================
+
+class SkillRegistry:
+    """
+    缓存解析后的 skill 目录和渲染好的 prompt。
+    只有当 skill 目录、SKILL.md 或 mcp_config.json 的 mtime/size 变化时才重新读取该 skill。
+    """
+
+    def __init__(self, skills_dir: str, recheck_interval: float = SKILLS_RECHECK_INTERVAL,
+                 catalog_path: Optional[str] = None):
+        self.skills_dir = skills_dir
+        self.recheck_interval = recheck_interval
+        # catalog_path=None 使用默认位置，"" 表示不读写快照
+        self.catalog_path = _default_catalog_path(skills_dir) if catalog_path is None else catalog_path
+        self._catalog_loaded = False
+        self._skills: Dict[str, Dict[str, Any]] = {}
+        self._stamps: Dict[str, Tuple] = {}  # skill_id -> 文件指纹
+        self._root_stamp: Optional[Tuple[int, int]] = None
+        self._prompt: Optional[str] = None
+        self._tool_index: Optional["SkillToolIndex"] = None
+        self._retriever: Optional[BM25Index] = None
+        self._contexts: Dict[str, Tuple[Tuple, str]] = {}  # skill_id -> (指纹, SKILL.md 全文)
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def _skill_stamp(self, skill_dir: Path) -> Tuple:
+        return (
+            _stat_key(skill_dir),
+            _stat_key(skill_dir / "SKILL.md"),
+            _stat_key(skill_dir / "mcp_config.json"),
+        )
+
+    def _reset_derived(self) -> None:
+        self._prompt = None
+        self._tool_index = None
+        self._retriever = None
+
+    def _load_catalog_locked(self) -> None:
+        """从快照恢复目录；指纹仍需在随后的 refresh 中逐个校验"""
+        self._catalog_loaded = True
+        if not self.catalog_path:
+            return
+        try:
+            with open(self.catalog_path, 'rb') as f:
+                data = json.loads(f.read())
+        except (OSError, ValueError):
+            return
+        try:
+            if data.get("version") != CATALOG_VERSION or data.get("skills_dir") != os.path.abspath(self.skills_dir):
+                return
+            entries = data.get("skills", {})
+            skills = {skill_id: entry["info"] for skill_id, entry in entries.items()}
+            if not all(isinstance(info, dict) for info in skills.values()):
+                raise ValueError("skill info is not an object")
+            stamps = {skill_id: _as_tuple(entry["stamp"]) for skill_id, entry in entries.items()}
+            root_stamp = _as_tuple(data.get("root_stamp"))
+        except (KeyError, AttributeError, TypeError, ValueError) as e:
+            # 快照结构损坏：忽略快照，随后的 refresh 全量扫描并重写
+            print(f"⚠️ 技能目录快照无效，重新扫描: {e!r}")
+            return
+        self._skills, self._stamps, self._root_stamp = skills, stamps, root_stamp
+        self._reset_derived()
 
-        if skill_md.exists():
+    def _save_catalog_locked(self) -> None:
+        if not self.catalog_path:
+            return
+        data = {
+            "version": CATALOG_VERSION,
+            "skills_dir": os.path.abspath(self.skills_dir),
+            "root_stamp": self._root_stamp,
+            "skills": {
+                skill_id: {"stamp": self._stamps[skill_id], "info": info}
+                for skill_id, info in self._skills.items()
+            },
+        }
+        tmp_path = f"{self.catalog_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.catalog_path)
+        except OSError:
+            # 只读文件系统等情况下跳过快照，不影响正常扫描
             try:
-                with open(skill_md, 'r', encoding='utf-8') as f:
-                    skill_info["summary"] = f.read()[:500]
-            except:
+                os.remove(tmp_path)
+            except OSError:
                 pass
 
-        skills[skill_id] = skill_info
-    return skills
+    def _refresh_locked(self) -> None:
+        if not self._catalog_loaded:
+            self._load_catalog_locked()
 
+        skills_path = Path(self.skills_dir)
+        root_stamp = _stat_key(skills_path)
+        if root_stamp is None:
+            if self._skills:
+                self._skills = {}
+                self._stamps = {}
+                self._reset_derived()
+            self._root_stamp = None
+            return
 
-def _load_skill_context_sync(skill_id: str, skills_dir: str) -> str:
-    skill_md = Path(skills_dir) / skill_id / "SKILL.md"
-    if skill_md.exists():
+        # 根目录 mtime 只在增删条目时变化；条目不变时复用上次的目录列表
+        if root_stamp != self._root_stamp:
+            skill_ids = [p.name for p in skills_path.iterdir() if p.is_dir()]
+        else:
+            skill_ids = list(self._stamps)
+
+        changed = False
+        skills = dict(self._skills)
+        stamps = dict(self._stamps)
+
+        for skill_id in set(stamps) - set(skill_ids):
+            stamps.pop(skill_id, None)
+            skills.pop(skill_id, None)
+            changed = True
+
+        for skill_id in skill_ids:
+            skill_dir = skills_path / skill_id
+            stamp = self._skill_stamp(skill_dir)
+            if stamp[0] is None:
+                if skill_id in skills:
+                    stamps.pop(skill_id, None)
+                    skills.pop(skill_id, None)
+                    changed = True
+                continue
+            if stamps.get(skill_id) == stamp:
+                continue
+            skills[skill_id] = _scan_skill_dir(skill_dir)
+            stamps[skill_id] = stamp
+            changed = True
+
+        root_changed = root_stamp != self._root_stamp
+        self._root_stamp = root_stamp
+        if changed:
+            self._skills = skills
+            self._stamps = stamps
+            self._reset_derived()
+        if changed or root_changed:
+            self._save_catalog_locked()
+
+    def refresh(self, force: bool = False) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._last_check and now - self._last_check < self.recheck_interval:
+                return
+            self._refresh_locked()
+            self._last_check = now
+
+    def get_skills(self) -> Dict[str, Dict[str, Any]]:
+        self.refresh()
+        return self._skills
+
+    def get_skill(self, skill_id: str) -> Optional[Dict[str, Any]]:
+        return self.get_skills().get(skill_id)
+
+    def get_skills_prompt(self) -> str:
+        self.refresh()
+        prompt = self._prompt
+        if prompt is None:
+            prompt = _render_skills_prompt(self._skills)
+            self._prompt = prompt
+        return prompt
+
+    def load_context(self, skill_id: str) -> str:
+        """按需读取 SKILL.md 全文；文件指纹不变时复用上次读到的内容"""
+        info = self.get_skill(skill_id)
+        if not info or not info.get("skill_md_path"):
+            return f"Skill '{skill_id}' not found."
+        stamp = self._stamps.get(skill_id)
+        cached = self._contexts.get(skill_id)
+        if cached and cached[0] == stamp:
+            return cached[1]
         try:
-            with open(skill_md, 'r', encoding='utf-8') as f:
-                return f.read()
+            with open(info["skill_md_path"], 'r', encoding='utf-8') as f:
+                text = f.read()
         except:
-            pass
-    return f"Skill '{skill_id}' not found."
+            return f"Skill '{skill_id}' not found."
+        self._contexts[skill_id] = (stamp, text)
+        return text
+
+    def get_retriever(self) -> BM25Index:
+        self.refresh()
+        retriever = self._retriever
+        if retriever is None:
+            retriever = BM25Index({
+                skill_id: _skill_search_tokens(info) for skill_id, info in self._skills.items()
+            })
+            self._retriever = retriever
+        return retriever
+
+    def search(self, query: str, top_k: int = SKILLS_TOP_K) -> List[str]:
+        """按 name/description/tags 的 BM25 分数返回最相关的 skill_id"""
+        return [skill_id for skill_id, _ in self.get_retriever().search(query, top_k)]
+
+    def get_relevant_skills_prompt(self, query: str, top_k: int = SKILLS_TOP_K,
+                                   include: Optional[List[str]] = None) -> str:
+        """
+        只列出与 query 最相关的 top_k 个 skill，外加 include 中已加载的 skill。
+        top_k <= 0、query 为空或没有任何命中时退回完整列表，保证不会漏掉 skill。
+        """
+        if top_k <= 0 or not query:
+            return self.get_skills_prompt()
+        selected = set(self.search(query, top_k))
+        if not selected:
+            return self.get_skills_prompt()
+        skills = self._skills
+        selected.update(s for s in (include or []) if s in skills)
+        return _render_skills_prompt({skill_id: skills[skill_id] for skill_id in selected})
+
+    def get_tool_index(self) -> "SkillToolIndex":
+        self.refresh()
+        index = self._tool_index
+        if index is None:
+            index = SkillToolIndex(self._skills)
+            self._tool_index = index
+        return index
+
+    def invalidate(self) -> None:
+        """下一次访问时强制重新校验文件系统"""
+        with self._lock:
+            self._last_check = 0.0
+
+
+_registries: Dict[str, SkillRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def get_skill_registry(skills_dir: str = SKILLS_DIR) -> SkillRegistry:
+    """按目录返回进程内唯一的 SkillRegistry"""
+    key = os.path.abspath(skills_dir)
+    registry = _registries.get(key)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.get(key)
+            if registry is None:
+                registry = SkillRegistry(skills_dir)
+                _registries[key] = registry
+    return registry
+
+
+def _scan_skills_sync(skills_dir: str) -> Dict[str, Dict[str, Any]]:
+    return get_skill_registry(skills_dir).get_skills()
+
+
+def _load_skill_context_sync(skill_id: str, skills_dir: str) -> str:
+    return get_skill_registry(skills_dir).load_context(skill_id)
 
 
 async def scan_skills(skills_dir: str = SKILLS_DIR) -> Dict[str, Dict[str, Any]]:
@@ -76,49 +465,128 @@ async def load_skill_context(skill_id: str, skills_dir: str = SKILLS_DIR) -> str
     return await asyncio.to_thread(_load_skill_context_sync, skill_id, skills_dir)
 
 
-def _get_skills_prompt_sync(skills_dir: str) -> str:
-    skills = _scan_skills_sync(skills_dir)
+def _render_skill_line(skill_id: str, info: Dict[str, Any]) -> str:
+    description = (info.get("description") or "No description").replace("\n", " ")
+    if len(description) > 200:
+        description = description[:200] + "..."
+    return f'  <skill id="{skill_id}" has_mcp="{info["has_mcp"]}">{description}</skill>'
+
+
+def _render_skills_prompt(skills: Dict[str, Dict[str, Any]]) -> str:
     if not skills:
         return "<available_skills>No skills.</available_skills>"
 
     lines = ["<available_skills>"]
-    for skill_id, info in skills.items():
-        summary = info.get("summary", "No description")[:200].replace("\n", " ")
-        lines.append(f'  <skill id="{skill_id}" has_mcp="{info["has_mcp"]}">{summary}...</skill>')
+    for skill_id in sorted(skills):
+        info = skills[skill_id]
+        lines.append(info.get("prompt_line") or _render_skill_line(skill_id, info))
     lines.append("</available_skills>")
     return "\n".join(lines)
 
 
+def _get_skills_prompt_sync(skills_dir: str) -> str:
+    return get_skill_registry(skills_dir).get_skills_prompt()
+
+
 async def get_skills_prompt(skills_dir: str = SKILLS_DIR) -> str:
     return await asyncio.to_thread(_get_skills_prompt_sync, skills_dir)
 
 
+def _get_relevant_skills_prompt_sync(query: str, skills_dir: str, top_k: int,
+                                     include: Optional[List[str]]) -> str:
+    return get_skill_registry(skills_dir).get_relevant_skills_prompt(query, top_k, include)
+
+
+async def get_relevant_skills_prompt(query: str, skills_dir: str = SKILLS_DIR,
+                                     top_k: int = SKILLS_TOP_K,
+                                     include: Optional[List[str]] = None) -> str:
+    return await asyncio.to_thread(_get_relevant_skills_prompt_sync, query, skills_dir, top_k, include)
+
+
 # ============================================================================
 # 查找工具对应的 skill
 # ============================================================================
 
+_TOKEN_SPLIT = re.compile(r"[^0-9a-z]+")
+_TRIE_END = "\0"
+# 负缓存上限，超出后整体清空，避免被大量随机工具名撑爆
+NEGATIVE_CACHE_SIZE = 4096
+
+
+def _name_tokens(name: str) -> List[str]:
+    return [t for t in _TOKEN_SPLIT.split(name.lower()) if len(t) > 1 and not t.isdigit()]
+
+
+class SkillToolIndex:
+    """
+    工具名 -> skill_id 的倒排索引，在扫描时构建一次。
+      1. 精确匹配：工具名等于 skill_id 或 MCP server 名
+      2. 前缀 trie：skill_id / server 名是工具名的前缀，取最长者
+      3. token 匹配：按 `_`/`-`/`.` 切分后命中 token 数最多者
+    同分时按 skill_id 字典序取第一个，结果与目录遍历顺序无关。
+    """
+
+    def __init__(self, skills: Dict[str, Dict[str, Any]]):
+        self._exact: Dict[str, str] = {}
+        self._trie: Dict[str, Any] = {}
+        self._tokens: Dict[str, List[str]] = {}
+        self._negative: set = set()
+
+        for skill_id in sorted(skills):
+            keys = [skill_id] + list(skills[skill_id].get("mcp_tool_names", []))
+            for key in keys:
+                key = key.lower()
+                if not key:
+                    continue
+                self._exact.setdefault(key, skill_id)
+                node = self._trie
+                for ch in key:
+                    node = node.setdefault(ch, {})
+                node.setdefault(_TRIE_END, skill_id)
+                for token in _name_tokens(key):
+                    owners = self._tokens.setdefault(token, [])
+                    if skill_id not in owners:
+                        owners.append(skill_id)
+
+    def _longest_prefix(self, name: str) -> Optional[str]:
+        node = self._trie
+        found = None
+        for ch in name:
+            node = node.get(ch)
+            if node is None:
+                break
+            found = node.get(_TRIE_END, found)
+        return found
+
+    def _best_by_tokens(self, name: str) -> Optional[str]:
+        scores: Dict[str, int] = {}
+        for token in _name_tokens(name):
+            for skill_id in self._tokens.get(token, ()):
+                scores[skill_id] = scores.get(skill_id, 0) + 1
+        if not scores:
+            return None
+        return min(scores, key=lambda sid: (-scores[sid], sid))
+
+    def lookup(self, tool_name: str) -> Optional[str]:
+        name = tool_name.lower()
+        if name in self._negative:
+            return None
+
+        skill_id = (
+            self._exact.get(name)
+            or self._longest_prefix(name)
+            or self._best_by_tokens(name)
+        )
+        if skill_id is None:
+            if len(self._negative) >= NEGATIVE_CACHE_SIZE:
+                self._negative.clear()
+            self._negative.add(name)
+        return skill_id
+
+
 def _find_skill_for_tool_sync(tool_name: str, skills_dir: str) -> Optional[str]:
     """根据工具名猜测对应的 skill_id"""
-    skills = _scan_skills_sync(skills_dir)
-
-    # 策略1：工具名包含 skill_id
-    for skill_id in skills:
-        if skill_id in tool_name or tool_name in skill_id:
-            return skill_id
-
-    # 策略2：工具名包含 mcp server name
-    for skill_id, info in skills.items():
-        for server_name in info.get("mcp_tool_names", []):
-            if server_name in tool_name or tool_name.startswith(server_name):
-                return skill_id
-
-    # 策略3：模糊匹配（web-search -> web-search skill）
-    tool_prefix = tool_name.split("_")[0].split("-")[0]
-    for skill_id in skills:
-        if tool_prefix in skill_id:
-            return skill_id
-
-    return None
+    return get_skill_registry(skills_dir).get_tool_index().lookup(tool_name)
 
 
 async def find_skill_for_tool(tool_name: str, skills_dir: str = SKILLS_DIR) -> Optional[str]:
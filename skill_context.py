@@ -0,0 +1,101 @@
+import os
+import re
+from functools import lru_cache
+from typing import List, Tuple
+
+from retrieval import BM25Index, estimate_tokens, tokenize
+
+# ============================================================================
+# Skill 上下文预算：按标题切分 SKILL.md，只注入与对话相关且放得下的章节
+# ============================================================================
+
+# 每个已加载 skill 注入 system prompt 的 token 上限，<= 0 表示注入全文
+SKILL_CONTEXT_TOKEN_BUDGET = int(os.environ.get("SKILL_CONTEXT_TOKEN_BUDGET", "1500"))
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+
+
+def _strip_frontmatter(text: str) -> str:
+    if not text.startswith("---"):
+        return text
+    end = text.find("\n---", 3)
+    if end == -1:
+        return text
+    newline = text.find("\n", end + 4)
+    return text[newline + 1:] if newline != -1 else ""
+
+
+@lru_cache(maxsize=128)
+def split_sections(text: str) -> Tuple[Tuple[str, str], ...]:
+    """
+    按 markdown 标题切分为 [(标题, 章节文本)]，代码块内的 `#` 不算标题。
+    第一个标题之前的内容（如果有）标题为空字符串。
+    """
+    body = _strip_frontmatter(text)
+    sections: List[Tuple[str, str]] = []
+    title = ""
+    lines: List[str] = []
+    in_fence = False
+
+    for line in body.splitlines():
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        match = None if in_fence else _HEADING_RE.match(line)
+        if match:
+            if lines and "".join(lines).strip():
+                sections.append((title, "\n".join(lines).strip()))
+            title = match.group(2)
+            lines = [line]
+            continue
+        lines.append(line)
+
+    if lines and "".join(lines).strip():
+        sections.append((title, "\n".join(lines).strip()))
+    return tuple(sections)
+
+
+@lru_cache(maxsize=128)
+def _section_index(text: str) -> BM25Index:
+    sections = split_sections(text)
+    return BM25Index({str(i): tokenize(section) for i, (_, section) in enumerate(sections)})
+
+
+def budget_skill_context(text: str, query: str,
+                         budget: int = SKILL_CONTEXT_TOKEN_BUDGET) -> Tuple[str, List[str]]:
+    """
+    返回 (注入用文本, 被省略的章节标题)。
+    第一个章节（技能简介）总是保留，其余章节按与 query 的 BM25 相关度贪心装入预算，
+    最后按原文顺序拼接，保证读起来仍是一份连贯的文档。
+    """
+    sections = split_sections(text)
+    if budget <= 0 or not sections or estimate_tokens(text) <= budget:
+        return text, []
+
+    chosen = {0}
+    used = estimate_tokens(sections[0][1])
+    scores = _section_index(text).score(tokenize(query)) if query else {}
+    ranked = sorted(range(1, len(sections)), key=lambda i: (-scores.get(str(i), 0.0), i))
+
+    for i in ranked:
+        cost = estimate_tokens(sections[i][1])
+        if used + cost > budget:
+            continue
+        chosen.add(i)
+        used += cost
+
+    parts = [sections[i][1] for i in sorted(chosen)]
+    omitted = [sections[i][0] for i in range(len(sections)) if i not in chosen and sections[i][0]]
+    return "\n\n".join(parts), omitted
+
+
+def find_section(text: str, title: str) -> str:
+    """按标题查找章节：先精确匹配（忽略大小写），再子串匹配"""
+    wanted = title.strip().lower()
+    sections = split_sections(text)
+    for name, section in sections:
+        if name.lower() == wanted:
+            return section
+    for name, section in sections:
+        if wanted and wanted in name.lower():
+            return section
+    return ""
@@ -9,8 +9,10 @@ from langgraph.graph import  MessagesState
 
 class AgentState(MessagesState):
     available_skills: List[str]
-    skill_context: Dict[str, str]
+    skill_context: Dict[str, str]  # skill_id -> SKILL.md 内容哈希，正文在 context_store
     required_skills: List[str]
     task_complete: bool
     pending_tool_calls: List[dict]  # 暂存的工具调用
+    history_summary: str  # 已折叠轮次的滚动摘要
+    summarized_messages: int  # messages 中已折叠进摘要的条数
 
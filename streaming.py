@@ -0,0 +1,133 @@
+import json
+from contextlib import aclosing
+from typing import Any, Callable, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, message_chunk_to_message
+
+from metrics import metrics
+
+# ============================================================================
+# 流式决策：边生成边判断，能确定下一步时立即取消剩余生成
+# ============================================================================
+# - 某个工具调用的参数已完整、且该工具尚未加载 -> 停止，去 skill_node 加载后重放；
+# - 文本通过 LangGraph 的 custom stream 实时转发给调用方（CLI 标准输出 / 服务端 SSE）。
+# load_skill 和已加载工具的调用不提前截断，保留模型一次给出的多个并行调用。
+# 绑定的工具经过裁剪时，模型点名调用被裁剪的工具可能导致这次结果被丢弃重试：文本照常实时转发，
+# 出现这种调用后才暂存后续事件；确认重试时发送 reset 事件，调用方丢弃这次已经收到的文本。
+
+
+def _stream_writer() -> Callable[[Any], None]:
+    # 不在图里执行（或调用方没有订阅 custom 流）时写入是空操作
+    try:
+        from langgraph.config import get_stream_writer
+        return get_stream_writer()
+    except RuntimeError:
+        return lambda _: None
+
+
+class HoldingWriter:
+    """正常时直接转发；hold 之后暂存事件，flush 转发暂存的事件，reset 丢弃并通知调用方"""
+
+    def __init__(self, writer: Callable[[Any], None]):
+        self.writer = writer
+        self.holding = False
+        self._events: List[Any] = []
+        self._emitted = False
+
+    def __call__(self, event: Any) -> None:
+        if self.holding:
+            self._events.append(event)
+            return
+        self.writer(event)
+        self._emitted = True
+
+    def hold(self) -> None:
+        self.holding = True
+
+    def flush(self) -> None:
+        self.holding = False
+        for event in self._events:
+            self(event)
+        self._events.clear()
+
+    def reset(self) -> None:
+        self.holding = False
+        self._events.clear()
+        if self._emitted:
+            self.writer({"type": "reset"})
+            metrics.inc("llm.stream_reset")
+        self._emitted = False
+
+
+def _args_complete(args: Optional[str]) -> bool:
+    if not args:
+        return False
+    try:
+        return isinstance(json.loads(args), dict)
+    except ValueError:
+        return False
+
+
+class DecisionStream:
+    """累积模型输出的增量解析器；feed 返回 True 表示已能确定下一步，可以取消剩余生成"""
+
+    def __init__(self, needs_skill: Callable[[str], bool], writer: Callable[[Any], None],
+                 hold: Optional[Callable[[str], bool]] = None):
+        self.needs_skill = needs_skill
+        self.writer = writer
+        self.hold = hold
+        self.message: Optional[AIMessageChunk] = None
+        self._emitted = False
+        self.stopped_early = False
+
+    def feed(self, chunk: AIMessageChunk) -> bool:
+        self.message = chunk if self.message is None else self.message + chunk
+        if isinstance(chunk.content, str) and chunk.content:
+            self.writer({"type": "token", "text": chunk.content})
+            self._emitted = True
+
+        # 只看正在生成的最后一个调用，前面的调用在它开始时已经完整
+        tool_chunks = self.message.tool_call_chunks
+        if tool_chunks:
+            last = tool_chunks[-1]
+            if self.hold and last.get("name") and self.hold(last["name"]):
+                # 这次结果可能要重试，后面的输出先暂存
+                self.writer.hold()
+            if last.get("name") and self.needs_skill(last["name"]) and _args_complete(last.get("args")):
+                return True
+        return False
+
+    def result(self) -> AIMessage:
+        message = self.message or AIMessageChunk(content="")
+        if self.stopped_early:
+            # 截断时后面的工具调用可能只生成了一半，只保留参数完整的
+            message = AIMessageChunk(
+                content=message.content,
+                tool_call_chunks=[c for c in message.tool_call_chunks if _args_complete(c.get("args"))],
+                usage_metadata=message.usage_metadata,
+                id=message.id,
+            )
+        if self._emitted:
+            self.writer({"type": "end"})
+        return message_chunk_to_message(message)
+
+
+def holding_writer() -> HoldingWriter:
+    return HoldingWriter(_stream_writer())
+
+
+async def stream_decision(llm, messages: List[BaseMessage], needs_skill: Callable[[str], bool],
+                          writer: Optional[HoldingWriter] = None,
+                          hold: Optional[Callable[[str], bool]] = None) -> AIMessage:
+    """
+    astream 调用模型；能确定下一步时关闭流（底层 HTTP 连接随之关闭，服务端停止生成）。
+    传入 hold 时必须同时传入 writer：模型调用 hold 返回 True 的工具后，后续输出暂存在 writer 里。
+    """
+    parser = DecisionStream(needs_skill, writer or _stream_writer(), hold)
+    async with aclosing(llm.astream(messages)) as stream:
+        async for chunk in stream:
+            if parser.feed(chunk):
+                parser.stopped_early = True
+                metrics.inc("llm.stream_cancelled")
+                break
+    return parser.result()
@@ -0,0 +1,47 @@
+import os
+import sys
+import json
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LLM_API_KEY", "dummy")
+
+import batch  # noqa: E402
+
+
+def _truncated_output(tmp_path):
+    # 中断在中文字符中间："晴" 的 UTF-8 编码只写出了前两个字节
+    path = tmp_path / "out.jsonl"
+    done = json.dumps({"id": "0", "status": "ok", "answer": "多云"}, ensure_ascii=False) + "\n"
+    partial = '{"id": "1", "status": "ok", "answer": "' .encode("utf-8") + "晴".encode("utf-8")[:2]
+    path.write_bytes(done.encode("utf-8") + partial)
+    return path
+
+
+def test_completed_ids_ignores_truncated_multibyte_tail(tmp_path):
+    path = _truncated_output(tmp_path)
+    assert batch.completed_ids(str(path)) == {"0"}
+
+
+def test_resume_after_truncated_multibyte_tail(tmp_path):
+    path = _truncated_output(tmp_path)
+    tasks = tmp_path / "tasks.jsonl"
+    tasks.write_text('{"id": "0", "message": "你好"}\n', encoding="utf-8")
+
+    asyncio.run(batch.BatchRunner(str(path)).run(str(tasks)))
+
+    assert batch.ends_with_newline(str(path))
+    data = path.read_bytes()
+    # 半行之后补了换行，原有内容保持不变
+    assert data.endswith("晴".encode("utf-8")[:2] + b"\n")
+
+
+def test_ends_with_newline(tmp_path):
+    path = tmp_path / "out.jsonl"
+    assert batch.ends_with_newline(str(path))
+    path.write_bytes(b"")
+    assert batch.ends_with_newline(str(path))
+    path.write_bytes('{"answer": "晴"}\n'.encode("utf-8"))
+    assert batch.ends_with_newline(str(path))
+    path.write_bytes('{"answer": "晴'.encode("utf-8")[:-1])
+    assert not batch.ends_with_newline(str(path))
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import datetime
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from langchain_core.tools import BaseTool
+
+from metrics import metrics
+
+# ============================================================================
+# 幂等工具调用的结果缓存（TTL + 按字节计的 LRU）
+# ============================================================================
+
+# 缓存总字节上限
+TOOL_CACHE_MAX_BYTES = int(os.environ.get("TOOL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+def json_env(name: str, convert: Callable[[Any], Any] = float) -> Dict[str, Any]:
+    """
+    读取 {工具名: 数值} 形式的 JSON 环境变量。
+    不是合法 JSON 对象时整体忽略，无法转换的单项跳过，都只打印提示不抛异常。
+    """
+    raw = os.environ.get(name, "")
+    if not raw:
+        return {}
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        print(f"⚠️ 环境变量 {name} 不是合法 JSON，已忽略")
+        return {}
+    if not isinstance(value, dict):
+        print(f"⚠️ 环境变量 {name} 应为 JSON 对象，已忽略")
+        return {}
+    result = {}
+    for key, item in value.items():
+        try:
+            result[key] = convert(item)
+        except (TypeError, ValueError):
+            print(f"⚠️ 环境变量 {name} 中 {key} 的值 {item!r} 无效，已忽略")
+    return result
+
+
+# 按工具名覆盖 TTL（秒），0 表示不缓存，例如 {"maps_weather": 600, "view_file": 0}
+TOOL_CACHE_TTLS: Dict[str, float] = json_env("TOOL_CACHE_TTLS")
+# 声明了 readOnlyHint 的 MCP 工具默认缓存时长（秒）
+MCP_READONLY_CACHE_TTL = float(os.environ.get("MCP_READONLY_CACHE_TTL", "300"))
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    ttl: float
+    # 额外参与缓存键的状态（如文件 mtime），返回 None 表示这次不走缓存
+    key_extra: Optional[Callable[[dict], Any]] = None
+
+
+def _path_stamp(args: dict) -> Optional[Tuple[int, int]]:
+    try:
+        st = os.stat(args.get("path", "."))
+    except (OSError, TypeError):
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _today(args: dict) -> str:
+    # “明天”“下周五”这类相对时间依赖当天日期
+    return datetime.date.today().isoformat()
+
+
+# execute_bash / write_file 有副作用，永不缓存；
+# read_skill_section 读的是本地 SKILL.md，SkillRegistry 已按 mtime/size 缓存，再缓存结果只会在文件修改后返回旧内容
+DEFAULT_POLICIES: Dict[str, Optional[CachePolicy]] = {
+    "view_file": CachePolicy(300, _path_stamp),
+    "list_directory": CachePolicy(60, _path_stamp),
+    "parse_times": CachePolicy(600, _today),
+    "read_skill_section": None,
+    "execute_bash": None,
+    "write_file": None,
+}
+
+
+class ToolResultCache:
+    def __init__(self, max_bytes: int = TOOL_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[float, str, int]]" = OrderedDict()
+        self._bytes = 0
+        self._policies: Dict[str, Optional[CachePolicy]] = dict(DEFAULT_POLICIES)
+        self._lock = threading.Lock()
+
+    def register_policy(self, tool_name: str, policy: Optional[CachePolicy]) -> None:
+        """为工具指定缓存策略；policy=None 表示该工具不缓存"""
+        self._policies[tool_name] = policy
+
+    def policy_for(self, tool: BaseTool) -> Optional[CachePolicy]:
+        override = TOOL_CACHE_TTLS.get(tool.name)
+        policy = self._policies.get(tool.name)
+        if override is not None:
+            if float(override) <= 0:
+                return None
+            return CachePolicy(float(override), policy.key_extra if policy else None)
+        if tool.name in self._policies:
+            return policy
+        # 未登记的工具：MCP 声明只读时才缓存
+        if (tool.metadata or {}).get("readOnlyHint") and MCP_READONLY_CACHE_TTL > 0:
+            return CachePolicy(MCP_READONLY_CACHE_TTL)
+        return None
+
+    def make_key(self, tool: BaseTool, args: Any) -> Optional[Tuple[str, float]]:
+        """返回 (缓存键, ttl)；工具不可缓存时返回 None"""
+        policy = self.policy_for(tool)
+        if policy is None or policy.ttl <= 0:
+            return None
+        extra = None
+        if policy.key_extra is not None:
+            extra = policy.key_extra(args if isinstance(args, dict) else {})
+            if extra is None:
+                return None
+        try:
+            canonical = json.dumps(args, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        except (TypeError, ValueError):
+            return None
+        return f"{tool.name}\0{canonical}\0{json.dumps(extra)}", policy.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                metrics.inc("tool_cache.misses")
+                return None
+            expires_at, value, size = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                metrics.inc("tool_cache.misses")
+                metrics.inc("tool_cache.expired")
+                return None
+            self._entries.move_to_end(key)
+            metrics.inc("tool_cache.hits")
+            return value
+
+    def put(self, key: str, value: str, ttl: float) -> None:
+        size = len(key.encode("utf-8")) + len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (time.monotonic() + ttl, value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                metrics.inc("tool_cache.evictions")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": metrics.get("tool_cache.hits"),
+            "misses": metrics.get("tool_cache.misses"),
+            "evictions": metrics.get("tool_cache.evictions"),
+        }
+
+
+tool_cache = ToolResultCache()
@@ -0,0 +1,122 @@
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.tools import BaseTool
+
+from metrics import metrics
+from prompts import content_hash
+from retrieval import BM25Index, tokenize
+from skill_context import split_sections
+
+# ============================================================================
+# 按对话内容挑选绑定的工具（本地 BM25，无需向量服务）
+# ============================================================================
+# 已加载技能的 MCP server 可能一次暴露十几个工具，全部 schema 都会随每次请求发送。
+# 这里按最近对话给工具打分，只绑定前 N 个和最近用过的工具；其余工具只在 prompt 里列出名字，
+# 模型点名调用时由 decision_node 回退为绑定全部工具。
+
+# 每次调用最多绑定的（非基础）工具数，<= 0 表示不裁剪
+TOOLS_TOP_N = int(os.environ.get("TOOLS_TOP_N", "6"))
+# 最近多少轮 AI 工具调用里用过的工具始终保留
+TOOLS_RECENT_TURNS = int(os.environ.get("TOOLS_RECENT_TURNS", "3"))
+TOOL_INDEX_CACHE_SIZE = 32
+
+
+def _schema_text(tool: BaseTool) -> str:
+    schema = tool.args_schema
+    if schema is None:
+        return ""
+    if not isinstance(schema, dict):
+        try:
+            schema = tool.get_input_schema().model_json_schema()
+        except Exception:
+            return ""
+    parts = []
+    for name, prop in (schema.get("properties") or {}).items():
+        parts.append(name)
+        if isinstance(prop, dict) and prop.get("description"):
+            parts.append(str(prop["description"]))
+    return " ".join(parts)
+
+
+def tool_signature(tool: BaseTool) -> str:
+    """工具的名字 + 描述 + 参数 schema；MCP 重连后同名工具的对象会换，内容不变时签名不变"""
+    schema = tool.args_schema
+    if schema is not None and not isinstance(schema, dict):
+        try:
+            schema = tool.get_input_schema().model_json_schema()
+        except Exception:
+            schema = str(schema)
+    return json.dumps([tool.name, tool.description or "", schema], ensure_ascii=False, sort_keys=True, default=str)
+
+
+def skill_hints(skill_context: Dict[str, str], tool_names: Iterable[str]) -> Dict[str, str]:
+    """SKILL.md 中提到某个工具的章节（用法说明、典型场景），作为该工具的补充描述"""
+    names = list(tool_names)
+    hints: Dict[str, List[str]] = {}
+    for skill_id in sorted(skill_context):
+        for _, section in split_sections(skill_context[skill_id]):
+            for name in names:
+                if name in section:
+                    hints.setdefault(name, []).append(section)
+    return {name: "\n".join(sections) for name, sections in hints.items()}
+
+
+def tool_search_tokens(tool: BaseTool, hint: str = "") -> List[str]:
+    # 工具名权重最高，其次是描述，参数说明和 SKILL.md 章节作补充
+    name = tokenize(tool.name.replace("_", " "))
+    return name * 3 + tokenize(tool.description or "") * 2 + tokenize(_schema_text(tool)) + tokenize(hint)
+
+
+class ToolRanker:
+    def __init__(self, cache_size: int = TOOL_INDEX_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._indexes: "OrderedDict[str, BM25Index]" = OrderedDict()
+
+    def _index(self, tools: List[BaseTool], skill_context: Dict[str, str]) -> BM25Index:
+        key = content_hash(
+            *(tool_signature(t) for t in tools),
+            *(f"{k}\0{skill_context[k]}" for k in sorted(skill_context)),
+        )
+        index = self._indexes.get(key)
+        if index is not None:
+            self._indexes.move_to_end(key)
+            return index
+        hints = skill_hints(skill_context, [t.name for t in tools]) if skill_context else {}
+        index = BM25Index({t.name: tool_search_tokens(t, hints.get(t.name, "")) for t in tools})
+        self._indexes[key] = index
+        if len(self._indexes) > self.cache_size:
+            self._indexes.popitem(last=False)
+        return index
+
+    def rank(self, tools: List[BaseTool], query: str,
+             skill_context: Optional[Dict[str, str]] = None) -> List[Tuple[str, float]]:
+        """返回 [(工具名, 分数)]，按分数降序；与查询无词项重合的工具不出现"""
+        if not tools or not query:
+            return []
+        return self._index(tools, skill_context or {}).search(query, len(tools))
+
+    def select(self, tools: List[BaseTool], query: str, recent: Iterable[str] = (),
+               skill_context: Optional[Dict[str, str]] = None, top_n: int = TOOLS_TOP_N,
+               pinned: Iterable[str] = ()) -> List[BaseTool]:
+        """
+        保留 pinned（基础工具）、recent（最近用过的）和得分前 top_n 的工具，顺序与输入一致。
+        候选数不超过 top_n 或查询没有命中任何工具时不裁剪。
+        """
+        pinned = set(pinned)
+        candidates = [t for t in tools if t.name not in pinned]
+        if top_n <= 0 or len(candidates) <= top_n:
+            return tools
+        ranked = self.rank(candidates, query, skill_context)
+        if not ranked:
+            metrics.inc("tools.prune_skipped")
+            return tools
+        keep = pinned | set(recent) | {name for name, _ in ranked[:top_n]}
+        selected = [t for t in tools if t.name in keep]
+        metrics.inc("tools.pruned", len(tools) - len(selected))
+        return selected
+
+
+tool_ranker = ToolRanker()
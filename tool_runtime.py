@@ -0,0 +1,132 @@
+import os
+import asyncio
+import functools
+from contextlib import AsyncExitStack
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import BaseTool
+
+from artifacts import ArtifactStore, artifact_store
+from loop_guard import LoopGuard
+from metrics import metrics
+from tool_cache import ToolResultCache, json_env, tool_cache
+
+# ============================================================================
+# 工具并发执行
+# ============================================================================
+
+# 单轮（一条 AIMessage 里的）工具调用并发上限
+TOOL_MAX_CONCURRENCY = int(os.environ.get("TOOL_MAX_CONCURRENCY", "8"))
+# 整个进程（常驻服务、批量执行的所有会话）同时执行的工具调用上限，<= 0 表示不限
+TOOL_PROCESS_MAX_CONCURRENCY = int(os.environ.get("TOOL_PROCESS_MAX_CONCURRENCY", "0"))
+# 按工具名的并发上限（整个进程共享），例如 {"execute_bash": 2}
+TOOL_CONCURRENCY_LIMITS: Dict[str, int] = json_env("TOOL_CONCURRENCY_LIMITS", int)
+# 单次调用的默认超时（秒）和按工具名的超时，例如 {"maps_direction_driving": 30}
+TOOL_TIMEOUT = float(os.environ.get("TOOL_TIMEOUT", "60"))
+TOOL_TIMEOUTS: Dict[str, float] = json_env("TOOL_TIMEOUTS")
+# 同步工具（execute_bash、parse_times 等）专用线程池大小
+TOOL_THREAD_POOL_SIZE = int(os.environ.get("TOOL_THREAD_POOL_SIZE", "8"))
+
+
+class ToolRunner:
+    """
+    并发执行一条 AIMessage 里的所有工具调用，结果按原顺序返回。
+    异步工具直接 await；同步工具放进专用线程池，不占用默认 executor。
+    超时的异步调用会被取消；同步调用无法中断，只是不再等待它的结果。
+    """
+
+    def __init__(self, max_concurrency: int = TOOL_MAX_CONCURRENCY,
+                 process_max_concurrency: int = TOOL_PROCESS_MAX_CONCURRENCY,
+                 limits: Optional[Dict[str, int]] = None,
+                 timeout: float = TOOL_TIMEOUT,
+                 timeouts: Optional[Dict[str, float]] = None,
+                 pool_size: int = TOOL_THREAD_POOL_SIZE,
+                 cache: Optional[ToolResultCache] = tool_cache,
+                 artifacts: Optional[ArtifactStore] = artifact_store):
+        self.max_concurrency = max_concurrency
+        self.process_max_concurrency = process_max_concurrency
+        self.limits = TOOL_CONCURRENCY_LIMITS if limits is None else limits
+        self.timeout = timeout
+        self.timeouts = TOOL_TIMEOUTS if timeouts is None else timeouts
+        self.cache = cache
+        self.artifacts = artifacts
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="tool")
+        self._guard = LoopGuard("tool_runtime")
+        self._process_sem: Optional[asyncio.Semaphore] = None
+        self._tool_sems: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphores(self, tool_name: str):
+        # 进程级和按工具名的信号量绑定事件循环，换了循环（如多次 asyncio.run）就重新创建；信号量无需关闭
+        if self._guard.changed():
+            self._process_sem = (asyncio.Semaphore(self.process_max_concurrency)
+                                 if self.process_max_concurrency > 0 else None)
+            self._tool_sems = {}
+        tool_sem = None
+        limit = self.limits.get(tool_name)
+        if limit:
+            tool_sem = self._tool_sems.get(tool_name)
+            if tool_sem is None:
+                tool_sem = asyncio.Semaphore(max(1, int(limit)))
+                self._tool_sems[tool_name] = tool_sem
+        return self._process_sem, tool_sem
+
+    async def _invoke(self, tool: BaseTool, args: Any) -> Any:
+        if getattr(tool, "coroutine", None) is None and getattr(tool, "func", None) is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(tool.invoke, args))
+        return await tool.ainvoke(args)
+
+    async def _run_one(self, tc: dict, tools_by_name: Dict[str, BaseTool],
+                       turn_sem: asyncio.Semaphore) -> ToolMessage:
+        tool_name = tc["name"]
+        tool_id = tc["id"]
+        tool = tools_by_name.get(tool_name)
+        if not tool:
+            return ToolMessage(content=f"Error: Tool '{tool_name}' not found.", tool_call_id=tool_id)
+
+        cache_key = self.cache.make_key(tool, tc["args"]) if self.cache is not None else None
+        if cache_key is not None:
+            cached = self.cache.get(cache_key[0])
+            if cached is not None:
+                return ToolMessage(content=cached, tool_call_id=tool_id)
+
+        process_sem, tool_sem = self._semaphores(tool_name)
+        timeout = float(self.timeouts.get(tool_name, self.timeout))
+        # 先等按工具名的名额，再占本轮和进程的名额，排队中的调用不挡住其它工具；各处获取顺序一致，不会死锁
+        async with AsyncExitStack() as slots:
+            for sem in (tool_sem, turn_sem, process_sem):
+                if sem is not None:
+                    await slots.enter_async_context(sem)
+            try:
+                result = await asyncio.wait_for(self._invoke(tool, tc["args"]), timeout=timeout)
+                content = str(result)
+                # 大输出写入 artifact，消息里只留预览和句柄；read_artifact 自身的输出已有长度上限
+                if (self.artifacts is not None and tool_name != "read_artifact"
+                        and self.artifacts.should_spill(content)):
+                    content = await asyncio.to_thread(self.artifacts.spill, content)
+                # 基础工具出错时返回 "Error..." 字符串而不是抛异常，这类结果不缓存
+                if cache_key is not None and not content.startswith("Error"):
+                    self.cache.put(cache_key[0], content, cache_key[1])
+                return ToolMessage(content=content, tool_call_id=tool_id)
+            except asyncio.TimeoutError:
+                metrics.inc("tools.timeouts")
+                return ToolMessage(
+                    content=f"Error: Tool '{tool_name}' timed out after {timeout:g}s",
+                    tool_call_id=tool_id
+                )
+            except Exception as e:
+                return ToolMessage(content=f"Error: {e}", tool_call_id=tool_id)
+
+    async def run(self, tool_calls: List[dict], tools_by_name: Dict[str, BaseTool]) -> List[ToolMessage]:
+        metrics.inc("tools.calls", len(tool_calls))
+        # 每轮独立的并发上限，不同会话之间互不占用
+        turn_sem = asyncio.Semaphore(max(1, self.max_concurrency))
+        return list(await asyncio.gather(*(self._run_one(tc, tools_by_name, turn_sem) for tc in tool_calls)))
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+tool_runner = ToolRunner()
@@ -1,10 +1,14 @@
 import os
 import subprocess
 from pathlib import Path
-from typing import Union, List
+from typing import Union, List, Optional
 from jionlp.gadget import  parse_time
 from langchain_core.tools import tool
 
+from artifacts import artifact_store
+from skill import get_skill_registry, SKILLS_DIR
+from skill_context import find_section, split_sections
+
 # ============================================================================
 # 基础工具
 # ============================================================================
@@ -76,3 +80,42 @@ def parse_times(time_contents: Union[str, List[str]]):
         })
     return data_list
 
+
+LOAD_SKILL_TOOL = "load_skill"
+
+
+@tool(LOAD_SKILL_TOOL)
+def load_skill(skill_ids: List[str]) -> str:
+    """
+    Load skills by id so that their MCP tools become available.
+    If you already know which tool of the skill to call and with what arguments, call it in the same response.
+    """
+    # 尚未加载的技能由 decision_node 交给 skill_node 处理，执行到这里说明技能已加载或不存在
+    registry = get_skill_registry(SKILLS_DIR)
+    unknown = [s for s in skill_ids if not registry.get_skill(s)]
+    if unknown:
+        return f"Error: skills not found: {unknown}. Pick skill ids from <available_skills>."
+    return f"Skills {skill_ids} are already loaded. Call their tools directly."
+
+
+@tool
+def read_skill_section(skill_id: str, section: str) -> str:
+    """Read a section of a loaded skill's SKILL.md that was omitted from the prompt, by its heading title."""
+    text = get_skill_registry(SKILLS_DIR).load_context(skill_id)
+    content = find_section(text, section)
+    if content:
+        return content
+    titles = [title for title, _ in split_sections(text) if title]
+    return f"Section '{section}' not found in skill '{skill_id}'. Available sections: {titles}"
+
+
+@tool
+def read_artifact(artifact_id: str, offset: int = 0, length: int = 4000,
+                  start_line: Optional[int] = None, end_line: Optional[int] = None) -> str:
+    """
+    Read part of a large tool output saved as artifact://<id>.
+    Use start_line/end_line (1-based, inclusive) for a line range, otherwise offset/length for a byte range.
+    """
+    if start_line is not None or end_line is not None:
+        return artifact_store.read_lines(artifact_id, start_line or 1, end_line)
+    return artifact_store.read_bytes(artifact_id, offset, length)